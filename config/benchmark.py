@@ -0,0 +1,392 @@
+import asyncio
+import datetime
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config import celery_app
+from config.services import AsyncTelegramSender, TelegramSender
+from config.tasks import send_notifications, update_telegram_ids
+from config.telegram_stub import TelegramStubServer
+from config.throttling import UserRateThrottle
+from habit_tracker import cache
+from habit_tracker.models import Habit
+from habit_tracker.paginators import DefaultPaginator
+from users.models import TelegramOffset, User
+
+# Password of all users created by factory
+PASSWORD = 'benchmark'
+
+# Time zones of users created by factory
+TIMEZONES = ('Europe/Moscow', 'Europe/London', 'Asia/Tokyo',
+             'America/New_York')
+
+# Metrics compared between runs and whether their lower value is better
+METRICS = {
+    'mean_ms': True,
+    'p50_ms': True,
+    'p95_ms': True,
+    'p99_ms': True,
+    'throughput_rps': False,
+    'queries': True,
+    'seconds': True,
+}
+
+
+def seed(users, habits, batch_size=1000):
+    """
+    Create `users` users with `habits` habits each. Users get Telegram IDs,
+    different time zones and the same password, which is hashed only once.
+    Habits are dated back a year
+    """
+    password = make_password(PASSWORD)
+    first = User.objects.count()
+    created = User.objects.bulk_create([
+        User(email=f'user{first + i}@benchmark.com', password=password,
+             telegram_id=first + i + 1, timezone=TIMEZONES[i % 4])
+        for i in range(users)
+    ], batch_size=batch_size)
+    batch = []
+    for user in created:
+        for i in range(habits):
+            habit = Habit(
+                place='home', action=f'action {i}',
+                time=datetime.time(i * 7 % 24, i * 13 % 60),
+                is_pleasant=i % 5 == 4, is_public=i % 4 == 0,
+                exec_time=60, period=1 + i % 7, owner=user,
+            )
+            # Schedule is computed like by `Habit.save()`
+            habit.update_reminder_slot(user.timezone)
+            habit.update_next_due()
+            batch.append(habit)
+            if len(batch) == batch_size:
+                Habit.objects.bulk_create(batch)
+                batch = []
+    Habit.objects.bulk_create(batch)
+    # Habits are created a year ago, so past days can be marked as done
+    if created:
+        Habit.objects.filter(
+            owner__gte=created[0].pk, owner__lte=created[-1].pk
+        ).update(created_on=datetime.date.today()
+                 - datetime.timedelta(days=365))
+    return created
+
+
+def summarize(durations, queries, seconds):
+    """
+    Compose statistics of request durations in seconds and query counts.
+    Throughput is the number of requests per `seconds` of wall time they
+    took, so it also counts overlapping requests and time between them
+    """
+    durations = sorted(durations)
+    percentiles = statistics.quantiles(durations, n=100, method='inclusive') \
+        if len(durations) > 1 else durations * 99
+    return {
+        'requests': len(durations),
+        'mean_ms': statistics.mean(durations) * 1000,
+        'p50_ms': percentiles[49] * 1000,
+        'p95_ms': percentiles[94] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'max_ms': durations[-1] * 1000,
+        'throughput_rps': len(durations) / seconds,
+        'queries': statistics.mean(queries),
+    }
+
+
+def measure(request, requests, prepare=None):
+    """
+    Send `requests` requests by `request` function and measure their
+    durations and the number of queries
+    """
+    durations, queries = [], []
+    wall_started = time.perf_counter()
+    for number in range(requests):
+        if prepare is not None:
+            prepare()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = request(number)
+            durations.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'Request failed with status {response.status_code}')
+        queries.append(len(context.captured_queries))
+    return summarize(durations, queries,
+                     time.perf_counter() - wall_started)
+
+
+def benchmark_endpoints(users, requests):
+    """
+    Measure endpoints of API. Habit lists are measured with empty cache
+    (cold) and with cached pages (warm)
+    """
+    client = APIClient()
+    user = users[0]
+    response = client.post('/users/token/', {'email': user.email,
+                                             'password': PASSWORD})
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+    emails = (f'new{number}@benchmark.com' for number in count())
+    habits = list(Habit.objects.filter(owner=user).values_list('pk',
+                                                               flat=True))
+    # Public feed is requested by its first pages
+    pages = min(10, max(1, -(-Habit.objects.filter(is_public=True).count()
+                             // DefaultPaginator.page_size)))
+    return {
+        'habits_list_cold': measure(
+            lambda number: client.get('/habits/'), requests,
+            prepare=lambda: cache.invalidate(user.pk)),
+        'habits_list_warm': measure(
+            lambda number: client.get('/habits/'), requests),
+        'habits_public_cold': measure(
+            lambda number: client.get('/habits/public/',
+                                      {'page': number % pages + 1}),
+            requests, prepare=cache.invalidate_public),
+        'habits_public_warm': measure(
+            lambda number: client.get('/habits/public/',
+                                      {'page': number % pages + 1}),
+            requests),
+        # Each request marks all habits of user on another day
+        'habits_complete': measure(
+            lambda number: client.post('/habits/complete/', [
+                {'habit': pk, 'date': datetime.date.today()
+                 - datetime.timedelta(days=number)}
+                for pk in habits
+            ], format='json'),
+            requests),
+        'users_register': measure(
+            lambda number: APIClient().post('/users/register/', {
+                'email': next(emails), 'password': PASSWORD}),
+            requests),
+        'users_token': measure(
+            lambda number: APIClient().post('/users/token/', {
+                'email': users[number % len(users)].email,
+                'password': PASSWORD}),
+            requests),
+    }
+
+
+def measure_task(run):
+    """Measure duration and the number of queries of task"""
+    with CaptureQueriesContext(connection) as context:
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'queries': len(context.captured_queries)}
+
+
+def benchmark_tasks(users):
+    """
+    Measure Celery tasks end-to-end against local stub of Telegram Bot API.
+    Rate limits of Telegram are lifted to measure the tasks themselves
+    """
+    results = {}
+    celery_app.conf.task_always_eager = True
+    try:
+        with TelegramStubServer() as stub, override_settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_RATE_LIMIT=10 ** 6):
+            User.objects.update(notified_on=None)
+            results['send_notifications'] = measure_task(send_notifications)
+            results['send_notifications']['messages'] = len(stub.messages)
+    finally:
+        celery_app.conf.task_always_eager = False
+    # Each user sends their email address to bot
+    updates = [
+        {'update_id': number, 'message': {
+            'text': user.email, 'chat': {'id': user.telegram_id},
+            'entities': [{'type': 'email'}]}}
+        for number, user in enumerate(users, start=1)
+    ]
+    TelegramOffset.objects.filter(pk=1).delete()
+    with TelegramStubServer(updates=updates, poll_wait=0.05) as stub, \
+            override_settings(TELEGRAM_URL=stub.url,
+                              TELEGRAM_POLL_DURATION=2):
+        started = time.monotonic()
+        result = measure_task(update_telegram_ids)
+        # Task polls until deadline, so time of processing all updates is
+        # taken when it confirms the last of them
+        result['seconds'] = stub.drained_at - started
+        result['updates'] = len(updates)
+    results['update_telegram_ids'] = result
+    return results
+
+
+def measure_concurrent(send, requests, concurrency):
+    """
+    Send `requests` async requests keeping at most `concurrency` of them in
+    flight and measure their durations
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def measure_one(number):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await send(number)
+            durations.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'Request failed with status {response.status_code}')
+
+    async def measure_all():
+        started = time.perf_counter()
+        await asyncio.gather(*(measure_one(number)
+                               for number in range(requests)))
+        return time.perf_counter() - started
+
+    # Async queries are executed by the current thread, so they share its
+    # connection and see data of the current transaction
+    seconds = async_to_sync(measure_all)()
+    result = summarize(durations, [0], seconds)
+    del result['queries']
+    return result
+
+
+def benchmark_concurrency(users, requests, concurrency, latency):
+    """
+    Compare a single WSGI worker, which serves requests one by one, with a
+    single ASGI worker serving async endpoint, and delivery of messages by
+    pool of threads with delivery by event loop when each message takes
+    `latency` seconds
+    """
+    user = users[0]
+    habits = list(Habit.objects.filter(owner=user).values_list('pk',
+                                                               flat=True))
+    token = f'Bearer {AccessToken.for_user(user)}'
+    client = APIClient()
+    async_client = AsyncClient()
+    results = {
+        'wsgi_habit_detail': measure(
+            lambda number: client.get(
+                f'/habits/{habits[number % len(habits)]}/',
+                HTTP_AUTHORIZATION=token),
+            requests),
+        'asgi_habit_detail': measure_concurrent(
+            lambda number: async_client.get(
+                f'/async/habits/{habits[number % len(habits)]}/',
+                AUTHORIZATION=token),
+            requests, concurrency),
+    }
+    messages = [(user.telegram_id, 'benchmark') for user in users]
+    for name, sender in (('telegram_threads', TelegramSender),
+                         ('telegram_async', AsyncTelegramSender)):
+        with TelegramStubServer(delay=latency) as stub, override_settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_RATE_LIMIT=10 ** 6):
+            started = time.perf_counter()
+            sender().deliver(messages)
+            seconds = time.perf_counter() - started
+        results[name] = {'seconds': seconds,
+                         'throughput_rps': len(messages) / seconds}
+    return results
+
+
+def measure_threads(run, requests, concurrency):
+    """
+    Call `run` `requests` times by `concurrency` threads and measure
+    durations of calls and throughput
+    """
+    def measure_one(number):
+        started = time.perf_counter()
+        run(number)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        durations = list(executor.map(measure_one, range(requests)))
+    seconds = time.perf_counter() - started
+    result = summarize(durations, [0], seconds)
+    del result['queries']
+    return result
+
+
+def benchmark_passwords(requests, concurrency):
+    """
+    Measure hashing of passwords on registration and their verification on
+    token issuance by request threads and by pool of processes
+    """
+    encoded = make_password(PASSWORD)
+    results = {}
+    for name, workers in (('threads', 0), ('processes', os.cpu_count())):
+        with override_settings(PASSWORD_HASH_WORKERS=workers):
+            results[f'hash_password_{name}'] = measure_threads(
+                lambda number: make_password(PASSWORD), requests,
+                concurrency)
+            results[f'check_password_{name}'] = measure_threads(
+                lambda number: check_password(PASSWORD, encoded), requests,
+                concurrency)
+    return results
+
+
+def benchmark_throttling(users, requests):
+    """
+    Measure overhead of rate limiting of a single request by sliding window
+    counters in cache
+    """
+    request = Request(APIRequestFactory().get('/habits/'))
+    request.user = users[0]
+    durations = []
+    with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {'user': f'{requests + 1}/min'}}):
+        wall_started = time.perf_counter()
+        for _ in range(requests):
+            started = time.perf_counter()
+            allowed = UserRateThrottle().allow_request(request, None)
+            durations.append(time.perf_counter() - started)
+            if not allowed:
+                raise RuntimeError('Request was throttled')
+    result = summarize(durations, [0], time.perf_counter() - wall_started)
+    del result['queries']
+    return {'sliding_window': result}
+
+
+def run_benchmark(users, habits, requests, concurrency=50, latency=0.05):
+    """
+    Seed database with users and habits and measure endpoints and tasks.
+    Rates of requests are not limited except by throttling scenario
+    """
+    created = seed(users, habits)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+        results = {
+            'endpoints': benchmark_endpoints(created, requests),
+            'tasks': benchmark_tasks(created),
+            'concurrency': benchmark_concurrency(created, requests,
+                                                 concurrency, latency),
+            'passwords': benchmark_passwords(requests, concurrency),
+        }
+    results['throttling'] = benchmark_throttling(created, requests)
+    return results
+
+
+def compare(baseline, results):
+    """
+    Compare metrics of two runs. Yields name of scenario and metric, both
+    values and relative change, which is positive for improvements
+    """
+    for group in ('endpoints', 'tasks', 'concurrency', 'passwords',
+                  'throttling'):
+        for name, metrics in results.get(group, {}).items():
+            previous = baseline.get(group, {}).get(name, {})
+            for metric, lower_is_better in METRICS.items():
+                if metric not in metrics or not previous.get(metric):
+                    continue
+                change = (metrics[metric] - previous[metric]) \
+                    / previous[metric]
+                if lower_is_better:
+                    change = (previous[metric] - metrics[metric]) \
+                        / previous[metric]
+                yield name, metric, previous[metric], metrics[metric], change
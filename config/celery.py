@@ -1,6 +1,10 @@
 import os
 
 from celery import Celery
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+
+from config import metrics
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -15,3 +19,22 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+@task_prerun.connect
+def track_task(task=None, **kwargs):
+    """Start measuring task if metrics are enabled"""
+    if settings.METRICS_ENABLED:
+        task.request.timings = metrics.start()
+
+
+@task_postrun.connect
+def observe_task(task=None, **kwargs):
+    """Record metrics of finished task"""
+    timings = getattr(task.request, 'timings', None)
+    if timings is None:
+        return
+    metrics.stop(timings)
+    metrics.observe('celery_task', {'task': task.name}, timings)
+    # Worker processes do not serve `/metrics`, so they publish at once
+    metrics.flush(force=True)
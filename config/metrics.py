@@ -0,0 +1,326 @@
+import bisect
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of histogram buckets for durations in seconds and for
+# numbers of queries
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Histograms recorded for each request and task
+HISTOGRAMS = (
+    ('duration_seconds', 'Total time', SECONDS_BUCKETS),
+    ('db_seconds', 'Time of database queries', SECONDS_BUCKETS),
+    ('db_queries', 'Number of database queries', QUERIES_BUCKETS),
+    ('external_seconds', 'Time of HTTP requests to external services',
+     SECONDS_BUCKETS),
+)
+
+# Descriptions of counters of events by name
+COUNTERS = {
+    'habit_tracker_list_cache_requests_total':
+        'Reads of cached pages of habit lists by result',
+}
+
+# Identifier of this process among all web and worker processes
+PROCESS_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+# Histograms and counters of this process by name and labels
+_registry = {}
+_registry_lock = threading.Lock()
+# Time of the last publication and slot of this process in cache
+_flushed = {'time': 0, 'slot': None}
+
+# Timings of request or task being executed. Context of request is passed
+# to threads executing its queries by `sync_to_async`, so queries of async
+# views are measured too, and concurrent async requests do not mix up
+_timings = ContextVar('timings', default=None)
+
+
+class Timings:
+    """
+    Database and external HTTP time of a single request or task. External
+    requests can be sent by several threads at once
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0
+        self.external_seconds = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Measure database query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def add_external(self, seconds):
+        with self.lock:
+            self.external_seconds += seconds
+
+
+def get_timings():
+    """Get timings of request or task being executed"""
+    return _timings.get()
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Measure query by timings of request or task if it is tracked"""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Measure queries of each connection of each thread"""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def track():
+    """
+    Measure database queries and external HTTP requests of the enclosed
+    block. Yields timings of the block
+    """
+    timings = start()
+    try:
+        yield timings
+    finally:
+        stop(timings)
+
+
+def start():
+    """Start tracking of timings which are not bound to a code block"""
+    timings = Timings()
+    timings.token = _timings.set(timings)
+    return timings
+
+
+def stop(timings):
+    """Stop tracking of timings started by `start`"""
+    _timings.reset(timings.token)
+
+
+@contextmanager
+def _external_timer(timings):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_external(time.perf_counter() - started)
+
+
+def external_timer(timings=None):
+    """
+    Measure external HTTP request. Timings of a thread pool worker are
+    passed explicitly, otherwise timings of the current thread are used
+    """
+    timings = timings or get_timings()
+    if timings is None:
+        return nullcontext()
+    return _external_timer(timings)
+
+
+class Histogram:
+    """Cumulative histogram in Prometheus format"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last count is for values above all buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {'buckets': self.buckets, 'counts': list(self.counts),
+                'sum': self.sum}
+
+
+class Counter:
+    """Counter of events in Prometheus format"""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self):
+        self.value += 1
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+def incr(name, labels):
+    """Count event of `COUNTERS`, e.g. hit of cache"""
+    if not settings.METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = Counter()
+        _registry[key].inc()
+
+
+def observe(kind, labels, timings):
+    """
+    Record timings of finished request or task to histograms. `kind` is
+    either `http_request` or `celery_task`
+    """
+    values = {
+        'duration_seconds': time.perf_counter() - timings.started,
+        'db_seconds': timings.db_seconds,
+        'db_queries': timings.db_queries,
+        'external_seconds': timings.external_seconds,
+    }
+    labels = tuple(sorted(labels.items()))
+    with _registry_lock:
+        for name, _, buckets in HISTOGRAMS:
+            key = (f'habit_tracker_{kind}_{name}', labels)
+            if key not in _registry:
+                _registry[key] = Histogram(buckets)
+            _registry[key].observe(values[name])
+    return values
+
+
+def snapshot():
+    """Get histograms and counters of this process"""
+    with _registry_lock:
+        return {key: histogram.snapshot()
+                for key, histogram in _registry.items()}
+
+
+def get_slot_key(slot):
+    """Compose cache key of metrics published by process in slot"""
+    return f'metrics:process:{slot}'
+
+
+def flush(force=False):
+    """
+    Publish histograms of this process to cache, so metrics of all web and
+    worker processes are exposed by any of them. Histograms are published
+    at most once per `METRICS_FLUSH_INTERVAL` seconds unless forced.
+    Each process claims one of `METRICS_MAX_PROCESSES` slots by atomic
+    `add`, so processes never overwrite each other's histograms, and
+    slots of stopped processes expire in `METRICS_PROCESS_TTL` seconds
+    """
+    now = time.monotonic()
+    if not force and now - _flushed['time'] < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _flushed['time'] = now
+    entry = {'process': PROCESS_ID, 'histograms': snapshot()}
+    slot = _flushed['slot']
+    if slot is not None:
+        current = cache.get(get_slot_key(slot))
+        # Expired slot can be claimed by another process
+        if current is None or current['process'] == PROCESS_ID:
+            cache.set(get_slot_key(slot), entry,
+                      settings.METRICS_PROCESS_TTL)
+            return
+    _flushed['slot'] = next(
+        (slot for slot in range(settings.METRICS_MAX_PROCESSES)
+         if cache.add(get_slot_key(slot), entry,
+                      settings.METRICS_PROCESS_TTL)),
+        None,
+    )
+
+
+def collect():
+    """Merge histograms and counters of all processes"""
+    entries = cache.get_many([get_slot_key(slot) for slot
+                              in range(settings.METRICS_MAX_PROCESSES)])
+    snapshots = [snapshot()]
+    snapshots += [entry['histograms'] for entry in entries.values()
+                  if entry['process'] != PROCESS_ID]
+    merged = {}
+    for histograms in snapshots:
+        for key, histogram in histograms.items():
+            if 'value' in histogram:
+                merged[key] = {'value': histogram['value']
+                               + merged.get(key, {'value': 0})['value']}
+                continue
+            if key not in merged:
+                merged[key] = {'buckets': histogram['buckets'],
+                               'counts': [0] * len(histogram['counts']),
+                               'sum': 0}
+            for i, value in enumerate(histogram['counts']):
+                merged[key]['counts'][i] += value
+            merged[key]['sum'] += histogram['sum']
+    return merged
+
+
+def format_labels(labels, **extra):
+    """Format labels of sample in Prometheus format"""
+    labels = [*labels, *extra.items()]
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    ) + '}'
+
+
+def render():
+    """
+    Render histograms and counters of all processes in Prometheus text
+    format
+    """
+    lines = []
+    described = set()
+    for (name, labels), histogram in sorted(collect().items()):
+        if 'value' in histogram:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {COUNTERS[name]}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{format_labels(labels)} '
+                         f'{histogram["value"]}')
+            continue
+        if name not in described:
+            described.add(name)
+            description = next(text for suffix, text, _ in HISTOGRAMS
+                               if name.endswith(suffix))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+        total = 0
+        bounds = [*histogram['buckets'], '+Inf']
+        for bound, value in zip(bounds, histogram['counts']):
+            total += value
+            lines.append(f'{name}_bucket{format_labels(labels, le=bound)} '
+                         f'{total}')
+        lines.append(f'{name}_sum{format_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{format_labels(labels)} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing(values):
+    """Compose value of `Server-Timing` header"""
+    app = values['duration_seconds'] - values['db_seconds'] \
+        - values['external_seconds']
+    return ', '.join([
+        f'db;dur={values["db_seconds"] * 1000:.1f};'
+        f'desc="{values["db_queries"]} queries"',
+        f'external;dur={values["external_seconds"] * 1000:.1f}',
+        f'app;dur={max(app, 0) * 1000:.1f}',
+        f'total;dur={values["duration_seconds"] * 1000:.1f}',
+    ])
@@ -0,0 +1,98 @@
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+from config import metrics
+
+
+class MetricsMiddleware:
+    """
+    Measures total time, database queries and external HTTP requests of
+    each request. Results are recorded to histograms of `/metrics` and sent
+    to client in `Server-Timing` header. Middleware is removed from chain
+    when metrics are disabled
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Body of streaming response is produced after this point and it is
+        # not measured
+        with metrics.track() as timings:
+            response = self.get_response(request)
+        return self.observe(request, response, timings)
+
+    async def __acall__(self, request):
+        with metrics.track() as timings:
+            response = await self.get_response(request)
+        return self.observe(request, response, timings)
+
+    def observe(self, request, response, timings):
+        """Record timings of request and add them to response"""
+        match = request.resolver_match
+        values = metrics.observe('http_request', {
+            'view': match.view_name if match else 'unresolved',
+            'method': request.method,
+        }, timings)
+        response['Server-Timing'] = metrics.server_timing(values)
+        metrics.flush()
+        return response
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Admits at most `MAX_CONCURRENT_REQUESTS` requests to be processed by
+    the process at once. Request waits for a free slot up to
+    `ADMISSION_TIMEOUT` seconds and is rejected with 503 afterwards, so
+    excess load is shed before it reaches the database. Middleware is
+    removed from chain when limit is not set
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.MAX_CONCURRENT_REQUESTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slots = threading.BoundedSemaphore(
+            settings.MAX_CONCURRENT_REQUESTS)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def reject(self):
+        """Compose response to request which was not admitted"""
+        response = JsonResponse({'detail': 'Server is busy, try again '
+                                           'later.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.slots.acquire(timeout=settings.ADMISSION_TIMEOUT):
+            return self.reject()
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
+
+    async def __acall__(self, request):
+        # Event loop cannot be blocked while waiting for a slot
+        if not self.slots.acquire(blocking=False):
+            return self.reject()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.slots.release()
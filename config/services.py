@@ -1,17 +1,590 @@
+import asyncio
+import datetime
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import groupby, islice
+from operator import attrgetter
+from zoneinfo import ZoneInfo
+
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Prefetch
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
-def get_bot_url():
+from config import metrics
+from habit_tracker.models import Habit
+from users import cache as user_cache
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Cache key of bot's invite link
+BOT_URL_CACHE_KEY = 'telegram:bot_url'
+
+# Cache key of the global rate limit of bot shared by all processes
+RATE_LIMIT_CACHE_KEY = 'telegram:rate'
+
+# Seconds of window by which tokens of shared bucket are counted
+SHARED_BUCKET_WINDOW = 0.1
+
+
+# Process-local copy of bot's invite link and time when it expires
+_bot_url = {'value': None, 'expires': 0}
+_bot_url_lock = threading.Lock()
+
+
+def fetch_bot_url():
     """
-    Get bot's invite link
+    Request bot's invite link from Telegram and store it in caches
     """
     # Identify API method
     method = '/getMe'
     # Compose URL for request
     url = settings.TELEGRAM_URL + settings.TELEGRAM_API_KEY + method
     # Get bot's information
-    response = requests.get(
-        url
+    with metrics.external_timer():
+        response = requests.get(
+            url,
+            timeout=settings.TELEGRAM_TIMEOUT,
+        )
+    bot_url = 'https://t.me/' + response.json()['result']['username']
+    cache.set(BOT_URL_CACHE_KEY, bot_url, settings.TELEGRAM_BOT_CACHE_TTL)
+    _bot_url.update(value=bot_url, expires=time.monotonic()
+                    + settings.TELEGRAM_BOT_LOCAL_TTL)
+    return bot_url
+
+
+def refresh_bot_url():
+    """
+    Refresh bot's invite link unless it is already being refreshed
+    """
+    if not _bot_url_lock.acquire(blocking=False):
+        return
+    try:
+        fetch_bot_url()
+    except (requests.RequestException, ValueError, KeyError,
+            TypeError) as error:
+        # Previous or fallback link is used until the next attempt. Missing
+        # URL or API key of Telegram fails here too
+        logger.warning("Bot's invite link cannot be refreshed: %r", error)
+    finally:
+        _bot_url_lock.release()
+
+
+def get_bot_url():
+    """
+    Get bot's invite link. The link is cached in process memory and in
+    Django cache, so Telegram is never requested on the caller's thread.
+    When link is expired or unknown it is refreshed in background and the
+    previous link or the configured bot username is used meanwhile. Returns
+    None if neither of them is known
+    """
+    if _bot_url['value'] and time.monotonic() < _bot_url['expires']:
+        return _bot_url['value']
+    bot_url = cache.get(BOT_URL_CACHE_KEY)
+    if bot_url:
+        _bot_url.update(value=bot_url, expires=time.monotonic()
+                        + settings.TELEGRAM_BOT_LOCAL_TTL)
+        return bot_url
+    # Link is refreshed by a single thread at once
+    if not _bot_url_lock.locked():
+        threading.Thread(target=refresh_bot_url, daemon=True).start()
+    if _bot_url['value']:
+        return _bot_url['value']
+    if settings.TELEGRAM_BOT_USERNAME:
+        return 'https://t.me/' + settings.TELEGRAM_BOT_USERNAME
+    return None
+
+
+def get_updates(offset, timeout=0):
+    """
+    Get updates of Telegram Bot starting from `offset` by long polling.
+    Only messages are requested. Returns None if Telegram refuses request,
+    e.g. by `409 Conflict` while another client polls or webhook is set
+    """
+    # Identify API method
+    method = '/getUpdates'
+    # Compose URL for request
+    url = settings.TELEGRAM_URL + settings.TELEGRAM_API_KEY + method
+    # Wait for updates at most `timeout` seconds
+    with metrics.external_timer():
+        response = requests.get(
+            url,
+            params={
+                'offset': offset,
+                'timeout': timeout,
+                'allowed_updates': json.dumps(['message']),
+            },
+            timeout=timeout + settings.TELEGRAM_TIMEOUT,
+        )
+    data = response.json()
+    if not data.get('ok'):
+        return None
+    return data['result']
+
+
+def link_telegram_ids(updates):
+    """
+    Update Telegram IDs for users who sent their email address to bot. The
+    whole batch of updates is applied by a constant number of queries
+    """
+    # Collect chat of the last message for each email address
+    chats = {}
+    for update in updates:
+        message = update.get('message', {})
+        entities = message.get('entities', [])
+        # Check type of message entity
+        if entities and entities[0]['type'] == 'email':
+            chats[message['text']] = message['chat']['id']
+    if not chats:
+        return 0
+    # Find users with these email addresses
+    users = list(User.objects.filter(email__in=chats).only('email'))
+    for user in users:
+        user.telegram_id = chats[user.email]
+    updated = User.objects.bulk_update(users, ['telegram_id'])
+    user_cache.invalidate_many([user.pk for user in users])
+    return updated
+
+
+def format_habit(habit):
+    """
+    Compose a line of notification message for a single habit
+    """
+    return (
+        f"*{habit.time.strftime('%H:%M')}*"
+        f" \\- {habit.action.upper()} in {habit.place}\n\n"
     )
-    return 'https://t.me/' + response.json()['result']['username']
+
+
+def compose_digest(habits):
+    """
+    Compose notification message for the list of habits to be done today
+    """
+    # Create message for telegram bot
+    message = "Hi there\\!\nHere are your habits for today:\n\n"
+    # Add each habit to message
+    for habit in habits:
+        message += format_habit(habit)
+    return message
+
+
+def compose_reminder(habits):
+    """
+    Compose reminder message for habits which should be done soon
+    """
+    message = "Reminder\\!\nIt is almost time for your habits:\n\n"
+    for habit in habits:
+        message += format_habit(habit)
+    return message
+
+
+def iter_digests(date, users=None, chunk_size=None):
+    """
+    Yield pairs of Telegram ID and digest message for each user with
+    Telegram ID. Users are streamed from server-side cursor by chunks and
+    habits of each chunk are fetched by a single query
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_CHUNK_SIZE
+    if users is None:
+        users = User.objects.all()
+    # Pleasant habits are not added to notification message
+    habits = Habit.objects.due_on(date).filter(
+        is_pleasant=False
+    ).only('owner', 'time', 'action', 'place').order_by('time')
+    # Skip users who still do not have Telegram ID established
+    users = users.filter(
+        telegram_id__isnull=False
+    ).only('pk', 'telegram_id').order_by('pk').prefetch_related(
+        Prefetch('habit_set', queryset=habits, to_attr='due_habits')
+    )
+    for user in users.iterator(chunk_size=chunk_size):
+        yield user.telegram_id, compose_digest(user.due_habits)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket which limits the rate of operations
+    """
+
+    def __init__(self, rate, capacity=None):
+        # Number of tokens added per second
+        self.rate = rate
+        # Maximum number of tokens bucket can hold
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # No tokens are given until this time
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Take one token from bucket if it is available. Otherwise returns
+        time left until the next token is available
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            # Refill bucket for the time passed since last update
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """
+        Stop giving tokens for `seconds`, so all users of bucket wait
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until,
+                                    time.monotonic() + seconds)
+
+    def is_full(self, now):
+        """
+        Check that bucket has been refilled, so it can be replaced by a new
+        one without allowing extra operations
+        """
+        with self.lock:
+            return now >= self.paused_until and \
+                self.tokens + (now - self.updated) * self.rate \
+                >= self.capacity
+
+    def acquire(self):
+        """
+        Take one token from bucket, waiting until it becomes available
+        """
+        while delay := self.take():
+            time.sleep(delay)
+
+    async def aacquire(self):
+        """
+        Take one token from bucket without blocking event loop
+        """
+        while delay := self.take():
+            await asyncio.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket shared by all web and worker processes through cache.
+    Tokens are counted by short windows of time, so each token takes a
+    single `incr` and pauses are seen by all processes. Process-local
+    bucket is used while cache is not available
+    """
+
+    def __init__(self, key, rate, capacity=None):
+        super().__init__(rate, capacity)
+        self.key = key
+        # Window holds at least one token, so low rates are kept too
+        self.window_tokens = max(1, int(self.rate * SHARED_BUCKET_WINDOW))
+        self.window = self.window_tokens / self.rate
+
+    def incr(self, key):
+        """Count token taken in window"""
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # The first token of window
+            if cache.add(key, 1, math.ceil(self.window) + 1):
+                return 1
+            return cache.incr(key)
+
+    def take(self):
+        """Override super class method by counting tokens in cache"""
+        now = time.time()
+        try:
+            paused_until = cache.get(f'{self.key}:paused') or 0
+            if now < paused_until:
+                return paused_until - now
+            window = int(now / self.window)
+            if self.incr(f'{self.key}:{window}') <= self.window_tokens:
+                return 0
+        except Exception:
+            return super().take()
+        return (window + 1) * self.window - now
+
+    def pause(self, seconds):
+        """Override super class method by pausing all processes"""
+        super().pause(seconds)
+        try:
+            paused_until = max(cache.get(f'{self.key}:paused') or 0,
+                               time.time() + seconds)
+            cache.set(f'{self.key}:paused', paused_until,
+                      math.ceil(seconds) + 1)
+        except Exception:
+            pass
+
+
+def get_retry_after(body):
+    """
+    Get seconds to wait from body of `429 Too Many Requests` response.
+    Body which is not a JSON of Telegram is waited for one second
+    """
+    try:
+        return float(json.loads(body)['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+def is_connect_error(error):
+    """
+    Check that request failed before it was sent, so message can be sent
+    again without duplicating it
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(error, requests.ConnectionError) and \
+        isinstance(reason, MaxRetryError) and \
+        isinstance(reason.reason, NewConnectionError)
+
+
+class TelegramSender:
+    """
+    Sends messages via Telegram Bot API concurrently using a bounded thread
+    pool over a shared HTTP session. Global and per-chat rate limits of
+    Telegram are respected and `429 Too Many Requests` responses pause all
+    workers for `retry_after` seconds. Global limit is shared by senders of
+    all processes, while chats of each sender are its own. Only requests
+    which failed to connect are retried, since other failures can happen
+    after message was sent
+    """
+
+    def __init__(self, workers=None, rate=None, chat_rate=None):
+        self.workers = workers or settings.TELEGRAM_WORKERS
+        # Share connection pool between all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Global limit of bot and limit for each chat
+        self.bucket = SharedTokenBucket(RATE_LIMIT_CACHE_KEY,
+                                        rate or settings.TELEGRAM_RATE_LIMIT)
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_LIMIT
+        # Buckets of chats by time of their last use
+        self.chat_buckets = OrderedDict()
+        self.lock = threading.Lock()
+        # Compose URL for request
+        self.url = (settings.TELEGRAM_URL + settings.TELEGRAM_API_KEY
+                    + '/sendMessage')
+        # Requests are measured on behalf of task which created sender
+        self.timings = metrics.get_timings()
+
+    def get_chat_bucket(self, chat_id):
+        """
+        Get token bucket of a single chat. Buckets of chats which have not
+        been used since they were refilled are dropped, so only buckets of
+        recent chats are kept
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.chat_buckets.pop(chat_id, None) or \
+                TokenBucket(self.chat_rate, 1)
+            while self.chat_buckets and \
+                    next(iter(self.chat_buckets.values())).is_full(now):
+                self.chat_buckets.popitem(last=False)
+            self.chat_buckets[chat_id] = bucket
+            return bucket
+
+    def send(self, chat_id, text):
+        """
+        Send a single message to chat. Returns True if message is delivered
+        """
+        # Identify parameters
+        params = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': 'MarkdownV2'
+        }
+        for _ in range(settings.TELEGRAM_MAX_RETRIES + 1):
+            self.get_chat_bucket(chat_id).acquire()
+            self.bucket.acquire()
+            try:
+                with metrics.external_timer(self.timings):
+                    response = self.session.post(
+                        self.url,
+                        params=params,
+                        timeout=settings.TELEGRAM_TIMEOUT,
+                    )
+            except requests.RequestException as error:
+                if is_connect_error(error):
+                    continue
+                return False
+            # Wait for the time requested by Telegram and try again
+            if response.status_code == 429:
+                self.bucket.pause(get_retry_after(response.content))
+                continue
+            return response.ok
+        return False
+
+    @staticmethod
+    def get_delivered(futures):
+        """
+        Get chat IDs of sent messages. Messages which failed with errors
+        are considered not delivered, so others are still recorded
+        """
+        return [future.chat_id for future in futures
+                if future.exception() is None and future.result()]
+
+    def deliver(self, messages):
+        """
+        Send pairs of chat ID and text concurrently. Only a bounded number
+        of messages is taken from iterable at once. Returns the list of chat
+        IDs which received the message
+        """
+        delivered = []
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for chat_id, text in messages:
+                # Wait for some messages to be sent if queue is full
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    delivered += self.get_delivered(done)
+                future = executor.submit(self.send, chat_id, text)
+                future.chat_id = chat_id
+                pending.add(future)
+            done, _ = wait(pending)
+            delivered += self.get_delivered(done)
+        return delivered
+
+
+class AsyncTelegramSender(TelegramSender):
+    """
+    Sends messages via Telegram Bot API from a single thread using asyncio
+    and `aiohttp`. Number of messages in flight is not limited by the number
+    of threads, so much higher concurrency is reached at the same rate
+    limits
+    """
+
+    def __init__(self, concurrency=None, rate=None, chat_rate=None):
+        if aiohttp is None:
+            raise ImproperlyConfigured(
+                'Package `aiohttp` is required by async Telegram sender')
+        self.concurrency = concurrency or settings.TELEGRAM_ASYNC_CONCURRENCY
+        super().__init__(workers=1, rate=rate, chat_rate=chat_rate)
+
+    async def asend(self, session, chat_id, text):
+        """
+        Send a single message to chat. Returns True if message is delivered
+        """
+        # Identify parameters
+        params = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': 'MarkdownV2'
+        }
+        for _ in range(settings.TELEGRAM_MAX_RETRIES + 1):
+            await self.get_chat_bucket(chat_id).aacquire()
+            await self.bucket.aacquire()
+            try:
+                with metrics.external_timer(self.timings):
+                    async with session.post(self.url,
+                                            params=params) as response:
+                        body = await response.read()
+            except aiohttp.ClientConnectorError:
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+            # Wait for the time requested by Telegram and try again
+            if response.status == 429:
+                self.bucket.pause(get_retry_after(body))
+                continue
+            return response.ok
+        return False
+
+    async def adeliver(self, messages):
+        """
+        Send pairs of chat ID and text concurrently. Returns the list of
+        chat IDs which received the message
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(
+                    total=settings.TELEGRAM_TIMEOUT)) as session:
+
+            async def send(chat_id, text):
+                async with semaphore:
+                    return await self.asend(session, chat_id, text)
+
+            results = await asyncio.gather(*(
+                send(chat_id, text) for chat_id, text in messages
+            ), return_exceptions=True)
+        # Messages which failed with errors are not delivered
+        return [chat_id for (chat_id, _), delivered
+                in zip(messages, results) if delivered is True]
+
+    def deliver(self, messages):
+        """
+        Send pairs of chat ID and text. Messages are taken from iterable by
+        batches outside of event loop, so they can be read from database
+        """
+        delivered = []
+        messages = iter(messages)
+        while batch := list(islice(messages, self.concurrency * 4)):
+            delivered += asyncio.run(self.adeliver(batch))
+        return delivered
+
+
+def get_sender():
+    """
+    Create sender of Telegram messages configured by `TELEGRAM_SENDER`
+    """
+    if settings.TELEGRAM_SENDER == 'async':
+        return AsyncTelegramSender()
+    return TelegramSender()
+
+
+def iter_reminders(start, minutes, chunk_size=None):
+    """
+    Yield Telegram ID, reminder message and IDs of habits which should be
+    done during `minutes` after UTC datetime `start`. Habits are looked up
+    by indexed reminder slot, so only rows of this time slot are read
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_CHUNK_SIZE
+    first_slot = start.hour * 60 + start.minute
+    # Pleasant habits are not added to notification message
+    habits = Habit.objects.filter(
+        reminder_slot__gte=first_slot,
+        reminder_slot__lt=first_slot + minutes,
+        next_due__lte=start.date() + datetime.timedelta(days=1),
+        is_pleasant=False,
+        owner__telegram_id__isnull=False,
+    ).select_related('owner').only(
+        'time', 'action', 'place', 'next_due', 'reminder_slot',
+        'owner', 'owner__telegram_id', 'owner__timezone',
+    ).order_by('owner', 'reminder_slot')
+    habits = habits.iterator(chunk_size=chunk_size)
+    for owner, owner_habits in groupby(habits, key=attrgetter('owner_id')):
+        due_habits = []
+        for habit in owner_habits:
+            # Date of habit in user's time zone
+            moment = start + datetime.timedelta(
+                minutes=habit.reminder_slot - first_slot)
+            date = moment.astimezone(ZoneInfo(habit.owner.timezone)).date()
+            if habit.next_due == date:
+                due_habits.append(habit)
+        if due_habits:
+            yield (due_habits[0].owner.telegram_id,
+                   compose_reminder(due_habits),
+                   [habit.pk for habit in due_habits])
@@ -14,6 +14,7 @@ from pathlib import Path
 
 # Custom libraries for environment variables
 import os
+import sys
 
 from celery.schedules import crontab
 from dotenv import load_dotenv
@@ -60,6 +61,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Measures the whole request, so it goes first
+    'config.middleware.MetricsMiddleware',
+    # Sheds excess load before any other work is done
+    'config.middleware.ConcurrencyLimitMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 
     'django.middleware.security.SecurityMiddleware',
@@ -127,6 +132,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashers, the first one is used for new passwords. Hasher of
+# project replaces the default PBKDF2 hasher of Django
+PASSWORD_HASHERS = [
+    'users.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Iterations of PBKDF2, passwords hashed with others are rehashed on login
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS',
+                                         600000))
+# Number of processes computing password hashes, 0 to compute them by
+# request threads
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0))
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -153,8 +174,29 @@ AUTH_USER_MODEL = 'users.User'
 # DRF Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Rates are limited by IP address of anonymous clients, by ID of users
+    # and by scope of views like registration
+    'DEFAULT_THROTTLE_CLASSES': [
+        'config.throttling.AnonRateThrottle',
+        'config.throttling.UserRateThrottle',
+        'config.throttling.ScopedRateThrottle',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '120/min',
+        'user': '600/min',
+        'register': '20/hour',
+        'token': '30/min',
+    },
+    # Number of reverse proxies in front of application. Client IP address
+    # is taken from `X-Forwarded-For` header set by them, while without
+    # proxies the header is ignored, so clients cannot forge their address
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 # Set due time for each token
 SIMPLE_JWT = {
@@ -162,27 +204,141 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# Redis server used by Celery and cache
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')
+
+# Cache settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL + '/1',
+    }
+}
+# Tests do not require running Redis server
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Maximum number of requests processed by each web process at once, 0 for
+# no limit, and time in seconds to wait for a free slot before rejection
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 0))
+ADMISSION_TIMEOUT = 0.5
+
+# Time in seconds to keep authenticated users in cache and in process memory
+USER_CACHE_TTL = 60 * 5
+USER_CACHE_LOCAL_TTL = 5
+# Maximum number of users kept in memory of each process
+USER_CACHE_LOCAL_SIZE = 10000
+
+# Collection of request and task metrics, disabled by default
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true')
+# Bearer token required by `/metrics` endpoint if it is set
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Seconds between publications of metrics of each process to cache
+METRICS_FLUSH_INTERVAL = 10
+# Seconds to keep metrics of process which stopped publishing them
+METRICS_PROCESS_TTL = 60 * 60 * 24
+# Maximum number of web and worker processes publishing metrics
+METRICS_MAX_PROCESSES = 256
+
+# Maximum number of habits in a single bulk request
+HABIT_BULK_MAX_SIZE = 1000
+
+# Maximum number of days of completion log in a single response
+HABIT_COMPLETION_MAX_DAYS = 366
+
+# Time in seconds to keep pages of habit list in cache
+HABIT_LIST_CACHE_TTL = 60 * 10
+
+# Time in seconds to keep statistics of habits in cache and range of user
+# IDs whose habits are counted together for global statistics
+HABIT_STATS_CACHE_TTL = 60 * 60 * 24
+HABIT_STATS_SHARD_SIZE = 20000
+
+# Number of habits read from database cursor at once during export
+HABIT_EXPORT_CHUNK_SIZE = 2000
+
+# Number of imported habits validated and inserted at once
+HABIT_IMPORT_BATCH_SIZE = 1000
+
+# Maximum number of invalid rows reported by import
+HABIT_IMPORT_MAX_ERRORS = 100
+
 # Broker settings for Celery
-CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
-CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
+CELERY_BROKER_URL = REDIS_URL + '/0'
+CELERY_RESULT_BACKEND = REDIS_URL + '/0'
 CELERY_IMPORTS = ("config.tasks",)
 CELERY_TIMEZONE = 'Europe/Moscow'
 
 # Telegram API settings
 TELEGRAM_API_KEY = os.getenv('TELEGRAM_API_KEY')
 TELEGRAM_URL = os.getenv('TELEGRAM_URL')
+# Bot username used when Telegram API is not available. Invite link is
+# omitted until it is known if username is not set
+TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME') or None
+# Time in seconds to keep bot's invite link in cache and in process memory
+TELEGRAM_BOT_CACHE_TTL = 60 * 60 * 24
+TELEGRAM_BOT_LOCAL_TTL = 60 * 5
+# Timeout of requests to Telegram API in seconds
+TELEGRAM_TIMEOUT = 10
+# Messages are sent by pool of 'threads' or by 'async' event loop
+TELEGRAM_SENDER = os.getenv('TELEGRAM_SENDER', 'threads')
+# Number of threads sending messages concurrently
+TELEGRAM_WORKERS = 16
+# Number of messages in flight of async sender
+TELEGRAM_ASYNC_CONCURRENCY = 256
+# Rate limits of Telegram: messages per second for bot and for a single chat
+TELEGRAM_RATE_LIMIT = 30
+TELEGRAM_CHAT_RATE_LIMIT = 1
+# Number of retries of a single message
+TELEGRAM_MAX_RETRIES = 3
+# Updates are received either by long 'polling' or by 'webhook'
+TELEGRAM_UPDATES_MODE = os.getenv('TELEGRAM_UPDATES_MODE', 'polling')
+# Secret token sent by Telegram in header of webhook requests
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+# Long polling: timeout of a single request and total duration of task
+TELEGRAM_POLL_TIMEOUT = 25
+TELEGRAM_POLL_DURATION = 50
+
+# Notification settings
+# Number of users fetched from database per chunk during digest
+NOTIFICATION_CHUNK_SIZE = 2000
+# Range of user IDs processed by a single digest task
+NOTIFICATION_SHARD_SIZE = 20000
+# Retries of digest task while some digests are not delivered
+NOTIFICATION_MAX_RETRIES = 3
+NOTIFICATION_RETRY_DELAY = 60
+# Either 'reminders' before each habit or daily 'digest' at 1am
+NOTIFICATION_MODE = os.getenv('NOTIFICATION_MODE', 'reminders')
+# Length of reminder time slot in minutes (must divide 60)
+NOTIFICATION_SLOT_MINUTES = 5
+# Reminders are sent this number of minutes before habit
+NOTIFICATION_LEAD_MINUTES = 10
 
 # Celery Beat Schedule
-CELERY_BEAT_SCHEDULE = {
-    'update-users': {
+CELERY_BEAT_SCHEDULE = {}
+if TELEGRAM_UPDATES_MODE == 'polling':
+    CELERY_BEAT_SCHEDULE['update-users'] = {
         'task': 'config.tasks.update_telegram_ids',
         'schedule': timedelta(minutes=1),
-    },
-    'notify-users': {
+    }
+if NOTIFICATION_MODE == 'digest':
+    CELERY_BEAT_SCHEDULE['notify-users'] = {
         'task': 'config.tasks.send_notifications',
         'schedule': crontab(hour='01', minute='00'),
-    },
-}
+    }
+else:
+    CELERY_BEAT_SCHEDULE['remind-users'] = {
+        'task': 'config.tasks.send_reminders',
+        'schedule': crontab(minute=f'*/{NOTIFICATION_SLOT_MINUTES}'),
+    }
+    CELERY_BEAT_SCHEDULE['refresh-reminder-slots'] = {
+        'task': 'config.tasks.refresh_reminder_slots',
+        'schedule': crontab(hour='00', minute='30'),
+    }
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
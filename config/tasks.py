@@ -1,86 +1,155 @@
 import datetime
+import logging
+import time
+from itertools import islice
 
-import requests
-from celery import shared_task
+from celery import shared_task, group
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Max, Q
+from django.utils import timezone
 
+from config.services import get_updates, iter_digests, iter_reminders, \
+    link_telegram_ids, get_sender
 from habit_tracker.models import Habit
-from users.models import User
+from users import cache as user_cache
+from users.models import TelegramOffset, User
+
+logger = logging.getLogger(__name__)
+
+# Cache key of lock held by the running task of long polling
+UPDATES_LOCK_KEY = 'telegram:updates:lock'
 
 
 @shared_task
 def update_telegram_ids():
     """
-    Check current updates of Telegram Bot and update Telegram IDs for users
+    Receive updates of Telegram Bot by long polling and update Telegram IDs
+    for users. Offset of the last processed update is stored in database, so
+    each update is processed only once. Telegram allows a single poller, so
+    the task is skipped while the previous run still polls
     """
-    # Identify API method
-    method = '/getUpdates'
-    # Compose URL for request
-    url = settings.TELEGRAM_URL + settings.TELEGRAM_API_KEY + method
-    # Get Bot updates
-    response = requests.get(
-        url
-    )
-    updates = response.json()['result']
-    # Search for new email addresses and update Telegram IDs for users
-    for update in updates:
-        # Check type of message entity
-        if update['message']['entities'][0]['type'] == 'email':
-            # Get email adressess
-            email = update['message']['text']
-            # Check if user with this email exists
-            if User.objects.filter(email=email).exists():
-                user = User.objects.get(email=email)
-                user.telegram_id = update['message']['chat']['id']
-                user.save()
-    # Confirm updates
-    if updates:
-        requests.get(
-            url,
-            params={'offset': updates[-1]['update_id'] + 1}
+    # Lock expires even if worker is lost during polling
+    timeout = settings.TELEGRAM_POLL_DURATION + settings.TELEGRAM_TIMEOUT
+    if not cache.add(UPDATES_LOCK_KEY, True, timeout):
+        return
+    try:
+        poll_updates()
+    finally:
+        cache.delete(UPDATES_LOCK_KEY)
+
+
+def poll_updates():
+    """Process updates until the next run of `update_telegram_ids`"""
+    offset, _ = TelegramOffset.objects.get_or_create(pk=1)
+    deadline = time.monotonic() + settings.TELEGRAM_POLL_DURATION
+    # Polls shorter than a second would follow each other without waiting
+    while (remaining := deadline - time.monotonic()) >= 1:
+        updates = get_updates(
+            offset.update_id,
+            timeout=min(settings.TELEGRAM_POLL_TIMEOUT, int(remaining))
         )
+        if updates is None:
+            # Updates are received by another client
+            return
+        if not updates:
+            continue
+        # Search for new email addresses and update Telegram IDs for users
+        link_telegram_ids(updates)
+        # Confirm updates
+        offset.update_id = updates[-1]['update_id'] + 1
+        offset.save(update_fields=['update_id'])
 
 
 @shared_task
 def send_notifications():
     """
-    Sends notification about habit for today to each user with Telegram ID
+    Sends notification about habit for today to each user with Telegram ID.
+    Users are partitioned by ID ranges which are processed by a group of
+    chunk tasks on all available workers
     """
-    # Identify API method
-    method = '/sendMessage'
-    # Compose URL for request
-    url = settings.TELEGRAM_URL + settings.TELEGRAM_API_KEY + method
+    # All chunks use the same date even if they are executed after midnight
+    today = datetime.date.today()
+    # Move habits with missed occurrences to their next occurrence
+    Habit.objects.catch_up(today)
+    # Identify range of IDs for users with Telegram ID
+    bounds = User.objects.filter(telegram_id__isnull=False).aggregate(
+        first=Min('pk'), last=Max('pk')
+    )
+    if bounds['first'] is None:
+        return
+    size = settings.NOTIFICATION_SHARD_SIZE
     # Send message to all users at 1am
-    for user in User.objects.all():
-        # Skip iteration if user still does not have Telegram ID established
-        if not user.telegram_id:
-            continue
-        # Create message for telegram bot
-        message = f"Hi there\!\nHere are your habits for today:\n\n"
-        # Identify the list of habits to be done today
-        habits = Habit.objects.filter(owner=user).order_by('time')
-        # Check each habit and add to message
-        for habit in habits:
-            # Find difference between creation date and today's date
-            diff = datetime.date.today() - habit.created_on
-            # Check if habit should be done today
-            if diff.days % habit.period != 0:
-                continue
-            # Pleasant habits are not added to notification message
-            elif not habit.is_pleasant:
-                # Update message for a single habit
-                message += (
-                    f"*{habit.time.strftime('%H:%M')}*"
-                    f" \- {habit.action.upper()} in {habit.place}\n\n"
-                )
-        # Identify parameters
-        params = {
-            'chat_id': user.telegram_id,
-            'text': message,
-            'parse_mode': 'MarkdownV2'
-        }
-        # Send notification
-        requests.post(
-            url,
-            params=params,
-        )
+    group(
+        send_notifications_chunk.s(start, start + size, today.isoformat())
+        for start in range(bounds['first'], bounds['last'] + 1, size)
+    ).apply_async()
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def send_notifications_chunk(self, start, end, date):
+    """
+    Sends notifications to users with IDs in range [start, end). Users who
+    have already received digest for the date are skipped, so the task can
+    be safely restarted after a failure. Task is retried while some digests
+    are not delivered, so only their users are notified again
+    """
+    date = datetime.date.fromisoformat(date)
+    users = User.objects.filter(pk__gte=start, pk__lt=end).filter(
+        Q(notified_on__isnull=True) | Q(notified_on__lt=date)
+    )
+    sender = get_sender()
+    digests = iter_digests(date, users)
+    undelivered = 0
+    # Mark users as notified after each batch of delivered messages
+    while batch := list(islice(digests, settings.NOTIFICATION_CHUNK_SIZE)):
+        delivered = sender.deliver(batch)
+        undelivered += len(batch) - len(delivered)
+        notified = list(users.filter(
+            telegram_id__in=delivered).values_list('pk', flat=True))
+        with transaction.atomic():
+            # Move notified habits to their next occurrence
+            Habit.objects.filter(owner__in=notified, next_due=date).advance()
+            User.objects.filter(pk__in=notified).update(notified_on=date)
+        user_cache.invalidate_many(notified)
+    if not undelivered:
+        return
+    if self.request.retries >= settings.NOTIFICATION_MAX_RETRIES:
+        logger.warning('Digests of %d users with IDs in [%d, %d) are not '
+                       'delivered', undelivered, start, end)
+        return
+    raise self.retry(countdown=settings.NOTIFICATION_RETRY_DELAY)
+
+
+@shared_task
+def send_reminders():
+    """
+    Sends reminders about habits which should be done in the upcoming time
+    slot according to time zone of each user
+    """
+    slot = settings.NOTIFICATION_SLOT_MINUTES
+    # Identify the start of time slot to be reminded about
+    start = timezone.now() + datetime.timedelta(
+        minutes=settings.NOTIFICATION_LEAD_MINUTES)
+    start = start.replace(minute=start.minute - start.minute % slot,
+                          second=0, microsecond=0)
+    reminders = list(iter_reminders(start, slot))
+    delivered = set(get_sender().deliver(
+        (telegram_id, message) for telegram_id, message, _ in reminders
+    ))
+    # Move notified habits to their next occurrence
+    Habit.objects.filter(pk__in=[
+        pk for telegram_id, _, habit_ids in reminders
+        if telegram_id in delivered for pk in habit_ids
+    ]).advance()
+
+
+@shared_task
+def refresh_reminder_slots():
+    """
+    Recomputes reminder slots of all habits to follow daylight saving time
+    and moves habits with missed occurrences to their next occurrence
+    """
+    Habit.objects.refresh_reminder_slots()
+    Habit.objects.catch_up(datetime.date.today())
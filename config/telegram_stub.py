@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class Server(ThreadingHTTPServer):
+    """HTTP server which accepts many concurrent connections"""
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class TelegramStubServer:
+    """
+    Local HTTP server imitating Telegram Bot API for tests and benchmarks.
+    Sent messages are recorded and the first `rate_limited` requests to
+    `sendMessage` are answered with `429 Too Many Requests`. Its body is
+    plain text like of proxies unless `retry_after` is set
+    """
+
+    def __init__(self, username='HabitTrackerBot', rate_limited=0,
+                 retry_after=0, updates=None, poll_wait=0, delay=0,
+                 conflict=False):
+        self.username = username
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        # List of updates returned by `getUpdates`
+        self.updates = updates or []
+        # Seconds `getUpdates` waits when there are no new updates
+        self.poll_wait = poll_wait
+        # `getUpdates` is refused like while another client polls
+        self.conflict = conflict
+        # Time when all updates have been confirmed by client
+        self.drained_at = None
+        # Network latency of each sent message in seconds
+        self.delay = delay
+        self.messages = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = Server(('127.0.0.1', 0), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    @property
+    def url(self):
+        """URL to be used as `TELEGRAM_URL` setting"""
+        return f'http://127.0.0.1:{self.server.server_port}/bot'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def respond(self, method, params):
+        """
+        Compose status and body of response for API method
+        """
+        with self.lock:
+            self.requests.append((method, params))
+            if method == 'getMe':
+                return 200, {'ok': True, 'result': {
+                    'id': 1, 'is_bot': True, 'username': self.username}}
+            if method == 'getUpdates' and self.conflict:
+                return 409, {'ok': False, 'error_code': 409,
+                             'description': 'Conflict'}
+            if method == 'getUpdates':
+                offset = int(params.get('offset', 0))
+                # At most 100 updates are returned at once like by Telegram
+                updates = [update for update in self.updates
+                           if update['update_id'] >= offset][:100]
+                if updates:
+                    return 200, {'ok': True, 'result': updates}
+                if self.drained_at is None:
+                    self.drained_at = time.monotonic()
+        if method == 'getUpdates':
+            # Imitate long polling without holding the lock
+            time.sleep(min(self.poll_wait, int(params.get('timeout', 0))))
+            return 200, {'ok': True, 'result': []}
+        if method == 'sendMessage':
+            time.sleep(self.delay)
+        with self.lock:
+            if method == 'sendMessage':
+                if self.rate_limited > 0:
+                    self.rate_limited -= 1
+                    if self.retry_after is None:
+                        return 429, 'Too Many Requests'
+                    return 429, {'ok': False, 'error_code': 429,
+                                 'parameters': {
+                                     'retry_after': self.retry_after}}
+                self.messages.append(params)
+                return 200, {'ok': True, 'result': {}}
+            return 404, {'ok': False, 'error_code': 404}
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Connections are kept alive like by Telegram
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are sent by a single packet without delay
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def handle_request(self):
+                url = urlparse(self.path)
+                params = {key: value[-1] for key, value
+                          in parse_qs(url.query).items()}
+                # Parameters can also be passed in request body
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    if self.headers.get('Content-Type') == \
+                            'application/json':
+                        params.update(json.loads(body))
+                    else:
+                        params.update({key: value[-1] for key, value
+                                       in parse_qs(body).items()})
+                method = url.path.rsplit('/', 1)[-1]
+                status, data = stub.respond(method, params)
+                if isinstance(data, str):
+                    body, content_type = data.encode(), 'text/plain'
+                else:
+                    body = json.dumps(data).encode()
+                    content_type = 'application/json'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = handle_request
+            do_POST = handle_request
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,111 @@
+import threading
+
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+# Counters of requests and their expiration time by cache key of window,
+# used while cache is not available
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_local_counts(current, previous):
+    """Get counters of the current and previous windows of this process"""
+    with _counters_lock:
+        return (_counters.get(current, (0, 0))[0],
+                _counters.get(previous, (0, 0))[0])
+
+
+def incr_local(key, now, timeout):
+    """Count request in window of this process"""
+    with _counters_lock:
+        count = _counters.get(key, (0, 0))[0]
+        # Expired counters are dropped when a new window starts
+        if not count:
+            for stale in [stale for stale, (_, expires) in _counters.items()
+                          if expires < now]:
+                del _counters[stale]
+        _counters[key] = (count + 1, now + timeout)
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Replaces the log of request timestamps of DRF throttle by counters of
+    fixed windows in cache. The number of requests in sliding window is
+    estimated from the current window and a part of the previous one, so
+    each request takes two cache operations regardless of the rate. Counters
+    are kept in process memory while cache is not available
+    """
+
+    def get_rate(self):
+        """Override super class method by reading rates on each request"""
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_counts(self, current, previous):
+        try:
+            counts = self.cache.get_many([current, previous])
+        except Exception:
+            return get_local_counts(current, previous)
+        return counts.get(current, 0), counts.get(previous, 0)
+
+    def incr(self, key):
+        try:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # The first request of window
+                if not self.cache.add(key, 1, self.duration * 2):
+                    self.cache.incr(key)
+        except Exception:
+            incr_local(key, self.now, self.duration * 2)
+
+    def allow_request(self, request, view):
+        """Override super class method by counting requests in windows"""
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.now = self.timer()
+        window, elapsed = divmod(self.now, self.duration)
+        current = f'{self.key}:{int(window)}'
+        previous = f'{self.key}:{int(window) - 1}'
+        self.count, self.previous_count = self.get_counts(current, previous)
+        # Part of the previous window which is still in sliding window
+        self.overlap = 1 - elapsed / self.duration
+        if self.count + self.previous_count * self.overlap \
+                >= self.num_requests:
+            return self.throttle_failure()
+        self.incr(current)
+        return True
+
+    def wait(self):
+        """
+        Override super class method by time until sliding window has room
+        for another request
+        """
+        window_left = self.overlap * self.duration
+        if self.count >= self.num_requests:
+            # Requests of the current window are still counted in the next
+            # one, so the rest of the next window is estimated by them
+            return window_left + self.duration * (
+                1 - (self.num_requests - 1) / self.count)
+        # Previous window slides out until its remaining requests fit
+        overlap = (self.num_requests - 1 - self.count) / self.previous_count
+        return max(window_left - overlap * self.duration, 0)
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    """Limits rate of requests of anonymous clients by IP address"""
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    """Limits rate of requests of authenticated users by their ID"""
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle,
+                         SlidingWindowRateThrottle):
+    """
+    Limits rate of requests to views with `throttle_scope` by user ID or IP
+    address
+    """
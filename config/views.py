@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from config import metrics
+
+
+def metrics_view(request):
+    """
+    Expose histograms of requests and tasks of all processes in Prometheus
+    text format
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    # Only scraper knows the token if it is configured
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
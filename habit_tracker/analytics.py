@@ -0,0 +1,114 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db.models import Count, Max, Q
+
+from habit_tracker import cache
+from habit_tracker.models import Habit
+from users.models import User
+
+# Periods of habits allowed by `HabitSerializer`
+PERIODS = range(1, 8)
+
+
+def get_aggregates():
+    """
+    Compose aggregates of all statistics. All of them are computed by a
+    single scan of habits, counters of hours compare times with bounds
+    """
+    aggregates = {
+        'habits': Count('id'),
+        'pleasant': Count('id', filter=Q(is_pleasant=True)),
+        'award': Count('id', filter=Q(award__isnull=False) & ~Q(award='')),
+        'associated_habit': Count('id',
+                                  filter=Q(associated_habit__isnull=False)),
+        'public': Count('id', filter=Q(is_public=True)),
+    }
+    for period in PERIODS:
+        aggregates[f'period_{period}'] = Count('id', filter=Q(period=period))
+    for hour in range(24):
+        bounds = Q(time__gte=datetime.time(hour))
+        if hour < 23:
+            bounds &= Q(time__lt=datetime.time(hour + 1))
+        aggregates[f'hour_{hour}'] = Count('id', filter=bounds)
+    return aggregates
+
+
+def count_habits(queryset):
+    """
+    Count habits of queryset by a single query. Counters can be summed up
+    for disjoint querysets
+    """
+    return queryset.order_by().aggregate(**get_aggregates())
+
+
+def merge(counters):
+    """Sum up counters of disjoint sets of habits"""
+    total = dict.fromkeys(get_aggregates(), 0)
+    for counter in counters:
+        for name, value in counter.items():
+            total[name] += value
+    return total
+
+
+def share(part, total):
+    return round(part / total, 4) if total else 0
+
+
+def represent(counters):
+    """Compose statistics from counters of habits"""
+    total = counters['habits']
+    return {
+        'habits': total,
+        'by_period': {str(period): counters[f'period_{period}']
+                      for period in PERIODS},
+        'by_hour': [counters[f'hour_{hour}'] for hour in range(24)],
+        'pleasant': counters['pleasant'],
+        'useful': total - counters['pleasant'],
+        'pleasant_ratio': share(counters['pleasant'], total),
+        'award': counters['award'],
+        'award_share': share(counters['award'], total),
+        'associated_habit': counters['associated_habit'],
+        'public': counters['public'],
+        'public_share': share(counters['public'], total),
+    }
+
+
+def get_user_stats(user_id):
+    """
+    Get statistics of user's habits. They are cached until habits of user
+    change, like pages of habit list
+    """
+    key = f'habits:{user_id}:stats:{cache.get_version(user_id)}'
+    stats = django_cache.get(key)
+    if stats is None:
+        stats = represent(count_habits(Habit.objects.filter(owner=user_id)))
+        django_cache.set(key, stats, settings.HABIT_STATS_CACHE_TTL)
+    return stats
+
+
+def get_global_stats(refresh=False):
+    """
+    Get statistics of habits of all users. Habits are counted by shards of
+    user IDs and only shards with changed habits are counted again, unless
+    `refresh` is set. Habits without owner are counted by their own shard
+    """
+    last = User.objects.aggregate(last=Max('id'))['last'] or 0
+    versions = cache.get_shard_versions(
+        [*range(cache.get_shard(last) + 1), cache.get_shard(None)])
+    keys = {shard: f'habits:shard:{shard}:stats:{version}'
+            for shard, version in versions.items()}
+    counters = {} if refresh else django_cache.get_many(keys.values())
+    size = settings.HABIT_STATS_SHARD_SIZE
+    for shard, key in keys.items():
+        if key not in counters:
+            if shard is None:
+                habits = Habit.objects.filter(owner__isnull=True)
+            else:
+                habits = Habit.objects.filter(
+                    owner__gte=shard * size, owner__lt=(shard + 1) * size)
+            counters[key] = count_habits(habits)
+            django_cache.set(key, counters[key],
+                             settings.HABIT_STATS_CACHE_TTL)
+    return represent(merge(counters[key] for key in keys.values()))
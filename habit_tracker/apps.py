@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HabitTrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'habit_tracker'
+
+    def ready(self):
+        # Connect signal receivers
+        from habit_tracker import signals  # noqa: F401
@@ -0,0 +1,181 @@
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, \
+    NotAuthenticated, NotFound, PermissionDenied, Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config.renderers import FastJSONRenderer
+from habit_tracker import cache
+from habit_tracker.models import Habit
+from habit_tracker.paginators import DefaultPaginator, KeysetPaginator, \
+    apaginate_queryset, is_keyset_requested
+from habit_tracker.serializers import HabitSerializer, get_expand, \
+    habit_values_serializer
+from users.authentication import CachedJWTAuthentication
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    """Compose JSON response"""
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code,
+                        content_type='application/json')
+
+
+def async_api(view):
+    """
+    Turn async function into GET endpoint of API. Request is wrapped by DRF
+    request to parse query parameters and API errors are rendered as JSON
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request)
+        try:
+            if request.method != 'GET':
+                raise MethodNotAllowed(request.method)
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            response = render({'detail': exc.detail}, exc.status_code)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(int(exc.wait))
+            return response
+    return wrapper
+
+
+def check_throttles(request):
+    """Limit rate of requests by default throttles of DRF views"""
+    durations = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            durations.append(throttle.wait())
+    if durations:
+        raise Throttled(wait=max(duration or 0 for duration in durations))
+
+
+async def acheck_throttles(request):
+    """
+    Async version of `check_throttles`. Cache operations of throttles are
+    executed by thread pool, so they do not block event loop. Throttles do
+    not query database, so concurrent requests do not wait for each other
+    """
+    await sync_to_async(check_throttles, thread_sensitive=False)(request)
+
+
+async def aauthenticate(request):
+    """
+    Authenticate user by JWT like `CachedJWTAuthentication`, but user
+    missing in cache is fetched by async query
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = None if header is None else \
+        authentication.get_raw_token(header)
+    if raw_token is None:
+        raise NotAuthenticated
+    token = authentication.get_validated_token(raw_token)
+    return await authentication.aget_user(token)
+
+
+# Pages contain links to async endpoints, so they are cached separately
+# from pages of sync endpoints
+KEY_PREFIX = 'async:'
+
+
+def get_paginator(request):
+    """Choose paginator requested by client"""
+    if is_keyset_requested(request):
+        return KeysetPaginator()
+    return DefaultPaginator()
+
+
+async def list_habits(queryset, request, viewer=None):
+    """
+    Fetch and serialize page of habits by async queries. Private associated
+    habits are inlined only for `viewer`
+    """
+    paginator = get_paginator(request)
+    expand = get_expand(request)
+    if expand:
+        page = await apaginate_queryset(
+            paginator, HabitSerializer.setup_queryset(queryset, expand),
+            request)
+        # Related habits are joined, so serializer does not query database
+        results = HabitSerializer(page, many=True,
+                                  context={'expand': expand,
+                                           'viewer': viewer}).data
+    else:
+        page = await apaginate_queryset(
+            paginator, habit_values_serializer.get_values(queryset),
+            request)
+        results = habit_values_serializer.to_representation(page)
+    return paginator.get_paginated_response(results).data
+
+
+@async_api
+async def habit_list(request):
+    """Async version of habit list of `HabitViewSet`"""
+    request.user = await aauthenticate(request)
+    await acheck_throttles(request)
+    user = request.user
+    key = KEY_PREFIX + await cache.aget_list_key(user.pk,
+                                                 request.query_params)
+    data = await cache.aget_list(key, request.resolver_match.view_name)
+    if data is None:
+        queryset = Habit.objects.filter(
+            owner=user
+        ).order_by(*KeysetPaginator.ordering)
+        data = await list_habits(queryset, request, user.pk)
+        await cache.aset_list(key, data)
+    return render(data)
+
+
+@async_api
+async def habit_detail(request, pk):
+    """Async version of habit retrieval of `HabitViewSet`"""
+    request.user = user = await aauthenticate(request)
+    await acheck_throttles(request)
+    expand = get_expand(request)
+    queryset = HabitSerializer.setup_queryset(Habit.objects.all(), expand)
+    try:
+        habit = await queryset.aget(pk=pk)
+    except Habit.DoesNotExist:
+        raise NotFound
+    # Only Owner can view this habit
+    if habit.owner_id != user.pk:
+        raise PermissionDenied
+    return render(HabitSerializer(habit, context={
+        'expand': expand, 'viewer': user.pk}).data)
+
+
+@async_api
+async def habit_public_list(request):
+    """
+    Async version of `HabitPublicListAPIView` with the same cache and
+    conditional responses
+    """
+    await acheck_throttles(request)
+    version = await cache.aget_public_version()
+    key = KEY_PREFIX + cache.get_public_key(version, request.query_params)
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    last_modified = version // 1000
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        data = await cache.aget_list(key, request.resolver_match.view_name)
+        if data is None:
+            queryset = Habit.objects.filter(
+                is_public=True
+            ).order_by(*KeysetPaginator.ordering)
+            data = await list_habits(queryset, request)
+            await cache.aset_list(key, data)
+        response = render(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
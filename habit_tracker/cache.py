@@ -0,0 +1,157 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from config import metrics
+
+# Query parameters which identify a page of habit list
+PAGE_PARAMS = ('pagination', 'cursor', 'page', 'page_size', 'expand')
+
+
+def count(view, data):
+    """Count hit or miss of cached page in metrics of view"""
+    metrics.incr('habit_tracker_list_cache_requests_total', {
+        'view': view, 'result': 'miss' if data is None else 'hit'})
+
+
+def new_version():
+    """
+    Get initial version of cached data. It is the current time in
+    milliseconds, so version which was evicted from cache does not start
+    again from a value whose data can still be cached
+    """
+    return int(time.time() * 1000)
+
+
+def get_version(user_id):
+    """
+    Get current version of habit list for user. Cached pages of previous
+    versions are never read again
+    """
+    return cache.get_or_set(f'habits:{user_id}:version', new_version,
+                            timeout=None)
+
+
+async def aget_version(user_id):
+    """Async version of `get_version`"""
+    return await cache.aget_or_set(f'habits:{user_id}:version', new_version,
+                                   timeout=None)
+
+
+def incr_version(key):
+    """Increment version unless it is not cached yet"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def invalidate(user_id):
+    """
+    Invalidate cached habit list and statistics of user and statistics of
+    its shard after any change of its habits
+    """
+    incr_version(f'habits:{user_id}:version')
+    invalidate_shard(get_shard(user_id))
+
+
+def invalidate_shard(shard):
+    """Invalidate statistics of shard after change of its habits"""
+    incr_version(f'habits:shard:{shard}:version')
+
+
+def get_shard(user_id):
+    """
+    Get number of shard of users which contains the user. Statistics of
+    all habits are counted by shards, habits without owner are the shard
+    None
+    """
+    if user_id is None:
+        return None
+    return user_id // settings.HABIT_STATS_SHARD_SIZE
+
+
+def get_shard_versions(shards):
+    """Get current versions of statistics of shards"""
+    keys = {shard: f'habits:shard:{shard}:version' for shard in shards}
+    versions = cache.get_many(keys.values())
+    missing = {key: new_version() for key in keys.values()
+               if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {shard: versions[key] for shard, key in keys.items()}
+
+
+def get_list_key(user_id, query_params):
+    """
+    Compose cache key for a single page of user's habit list identified by
+    pagination parameters of request
+    """
+    version = get_version(user_id)
+    page = ':'.join(query_params.get(param, '') for param in PAGE_PARAMS)
+    return f'habits:{user_id}:list:{version}:{page}'
+
+
+async def aget_list_key(user_id, query_params):
+    """Async version of `get_list_key`"""
+    version = await aget_version(user_id)
+    page = ':'.join(query_params.get(param, '') for param in PAGE_PARAMS)
+    return f'habits:{user_id}:list:{version}:{page}'
+
+
+def get_public_version():
+    """
+    Get time in milliseconds of the last change of public habits. It is
+    used as version of cached public feed and as its modification time
+    """
+    return cache.get_or_set('habits:public:version',
+                            lambda: int(time.time() * 1000), timeout=None)
+
+
+async def aget_public_version():
+    """Async version of `get_public_version`"""
+    return await cache.aget_or_set('habits:public:version',
+                                   lambda: int(time.time() * 1000),
+                                   timeout=None)
+
+
+def invalidate_public():
+    """
+    Invalidate cached public feed after any change of public habits
+    """
+    cache.set('habits:public:version', int(time.time() * 1000), None)
+
+
+def get_public_key(version, query_params):
+    """
+    Compose cache key for a single page of public feed identified by
+    pagination parameters of request
+    """
+    page = ':'.join(query_params.get(param, '') for param in PAGE_PARAMS)
+    return f'habits:public:list:{version}:{page}'
+
+
+def get_list(key, view):
+    """Get cached page of habit list requested by view"""
+    data = cache.get(key)
+    count(view, data)
+    return data
+
+
+def set_list(key, data):
+    """Save page of habit list in cache"""
+    cache.set(key, data, settings.HABIT_LIST_CACHE_TTL)
+
+
+async def aget_list(key, view):
+    """Async version of `get_list`"""
+    data = await cache.aget(key)
+    count(view, data)
+    return data
+
+
+async def aset_list(key, data):
+    """Async version of `set_list`"""
+    await cache.aset(key, data, settings.HABIT_LIST_CACHE_TTL)
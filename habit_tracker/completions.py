@@ -0,0 +1,76 @@
+import datetime
+from itertools import groupby
+
+from django.db import transaction
+
+from habit_tracker.models import CompletionStatus, HabitCompletion, \
+    HabitStats
+
+
+def mark_habits(habits, items):
+    """
+    Append completions of habits and update statistics of habits by the
+    new entries. `habits` are habits of user by ID and `items` are
+    validated completions. Completion of a date which is already in log is
+    ignored. Returns updated statistics by habit ID
+    """
+    with transaction.atomic():
+        # Statistics of habit are locked, so concurrent requests do not
+        # append the same dates twice. Rows are locked in order of IDs, so
+        # requests with overlapping habits do not deadlock
+        HabitStats.objects.bulk_create(
+            [HabitStats(habit_id=pk) for pk in sorted(habits)],
+            ignore_conflicts=True)
+        # `in_bulk()` drops ordering, so rows are locked by a plain query
+        stats = {row.pk: row for row in HabitStats.objects.select_for_update()
+                 .filter(pk__in=list(habits)).order_by('pk')}
+        existing = set(HabitCompletion.objects.filter(
+            habit__in=list(habits),
+            date__in={item['date'] for item in items},
+        ).values_list('habit_id', 'date'))
+        new = {}
+        for item in items:
+            key = (item['habit'], item['date'])
+            if key not in existing:
+                new.setdefault(key, item['status'])
+        HabitCompletion.objects.bulk_create([
+            HabitCompletion(habit_id=pk, date=date, status=status)
+            for (pk, date), status in new.items()
+        ])
+        # Later dates extend streaks, earlier ones require log of habit
+        changed, backfilled = set(), set()
+        for pk, date in sorted(key for key, status in new.items()
+                               if status == CompletionStatus.DONE):
+            if stats[pk].last_done_on is not None \
+                    and date < stats[pk].last_done_on:
+                backfilled.add(pk)
+            else:
+                stats[pk].add(date, habits[pk].period)
+            changed.add(pk)
+        if backfilled:
+            log = HabitCompletion.objects.filter(
+                habit__in=backfilled, status=CompletionStatus.DONE,
+            ).order_by('habit', 'date').values_list('habit_id', 'date')
+            for pk, rows in groupby(log, key=lambda row: row[0]):
+                stats[pk].recompute([date for _, date in rows],
+                                    habits[pk].period)
+        HabitStats.objects.bulk_update(
+            [stats[pk] for pk in changed],
+            ['done_count', 'current_streak', 'longest_streak',
+             'last_done_on'])
+    return stats
+
+
+def get_log(habit, start, end):
+    """Get completions of habit between dates ordered by date"""
+    return HabitCompletion.objects.filter(
+        habit=habit, date__range=(start, end),
+    ).order_by('date').values_list('date', 'status')
+
+
+def get_occurrences(habit, date=None):
+    """Get number of occurrences of habit from its creation up to date"""
+    date = date or datetime.date.today()
+    if habit.created_on is None or date < habit.created_on:
+        return 0
+    return (date - habit.created_on).days // habit.period + 1
@@ -0,0 +1,78 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+
+from habit_tracker.serializers import HabitSerializer, \
+    habit_values_serializer
+
+# Content types of supported export formats
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+def iter_habits(queryset, chunk_size=None):
+    """
+    Yield representations of habits read from server-side cursor by chunks,
+    so memory usage does not depend on the number of habits
+    """
+    chunk_size = chunk_size or settings.HABIT_EXPORT_CHUNK_SIZE
+    rows = habit_values_serializer.get_values(
+        queryset.order_by('pk')
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from habit_values_serializer.to_representation(chunk)
+
+
+def iter_ndjson(habits):
+    """Encode habits as one JSON object per line"""
+    for habit in habits:
+        yield json.dumps(habit, separators=(',', ':')) + '\n'
+
+
+def iter_json(habits):
+    """Encode habits as a JSON array without building it in memory"""
+    separator = '['
+    for habit in habits:
+        yield separator + json.dumps(habit, separators=(',', ':'))
+        separator = ','
+    # Empty export is an empty array
+    yield ']\n' if separator == ',' else '[]\n'
+
+
+class Echo:
+    """Pseudo-buffer which returns written value instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(habits):
+    """Encode habits as CSV rows with header"""
+    fields = HabitSerializer.Meta.fields
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for habit in habits:
+        yield writer.writerow(habit[name] for name in fields)
+
+
+# Encoders of supported export formats
+ENCODERS = {
+    'ndjson': iter_ndjson,
+    'json': iter_json,
+    'csv': iter_csv,
+}
+
+
+def export_habits(queryset, export_format, chunk_size=None):
+    """
+    Yield chunks of text of habits encoded in the given format
+    """
+    return ENCODERS[export_format](iter_habits(queryset, chunk_size))
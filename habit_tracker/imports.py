@@ -0,0 +1,154 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+
+from habit_tracker.serializers import HabitSerializer, get_related_habits
+
+# Number of characters read from file at once by JSON parser
+READ_SIZE = 64 * 1024
+
+
+def iter_ndjson(file):
+    """Yield row numbers and records of file with one JSON object per line"""
+    for row, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError as error:
+            yield row, ParseError(error)
+
+
+def iter_json(file):
+    """
+    Yield row numbers and records of JSON array. Array is decoded item by
+    item, so only a small part of file is kept in memory
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def read(position):
+        """Drop decoded part of buffer and append the next chunk"""
+        nonlocal buffer, eof
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        return 0
+
+    position = read(0)
+    while not eof and not buffer.strip():
+        position = read(len(buffer))
+    if not buffer.lstrip().startswith('['):
+        yield 1, ParseError('Expected a JSON array')
+        return
+    position = buffer.index('[') + 1
+    row = 0
+    while True:
+        # Skip whitespace and separators between items
+        while position < len(buffer) and (buffer[position].isspace()
+                                          or buffer[position] == ','):
+            position += 1
+        if position == len(buffer):
+            if eof:
+                yield row + 1, ParseError('Unexpected end of JSON array')
+                return
+            position = read(position)
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError as error:
+            if eof:
+                yield row + 1, ParseError(error)
+                return
+            # Item can be cut by the end of chunk
+            position = read(position)
+            continue
+        # Number at the end of chunk can be continued by the next one
+        if end == len(buffer) and not eof:
+            position = read(position)
+            continue
+        row += 1
+        position = end
+        yield row, record
+
+
+def iter_csv(file):
+    """
+    Yield row numbers and records of CSV file with header. Empty values
+    are considered missing
+    """
+    reader = csv.DictReader(file)
+    for record in reader:
+        yield reader.line_num, {key: value for key, value in record.items()
+                                if key and value not in ('', None)}
+
+
+class ParseError:
+    """Error of a record which cannot be decoded"""
+
+    def __init__(self, error):
+        self.message = str(error)
+
+
+# Parsers of supported import formats
+PARSERS = {
+    'ndjson': iter_ndjson,
+    'json': iter_json,
+    'csv': iter_csv,
+}
+
+
+def iter_records(file, import_format):
+    """
+    Yield row numbers and records of file. File which cannot be decoded
+    further is reported as error of the next row, like broken records, as
+    habits of previous batches are already saved
+    """
+    row = 0
+    try:
+        for row, record in PARSERS[import_format](file):
+            yield row, record
+    except UnicodeDecodeError:
+        yield row + 1, ParseError('File must be encoded in UTF-8')
+
+
+def import_habits(file, import_format, owner, batch_size=None):
+    """
+    Parse habits from text file incrementally, validate each of them by
+    `HabitSerializer` and insert valid habits by batches. Returns report
+    with the number of created habits and errors of invalid rows
+    """
+    batch_size = batch_size or settings.HABIT_IMPORT_BATCH_SIZE
+    records = iter_records(file, import_format)
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return report
+        # Associated habits of batch are fetched by a single query
+        context = {'related_habits': get_related_habits(
+            [record for _, record in batch], owner)}
+        valid = []
+        for row, record in batch:
+            if isinstance(record, ParseError):
+                errors = {'non_field_errors': [record.message]}
+            elif not isinstance(record, dict):
+                errors = {'non_field_errors': ['Expected a habit object']}
+            else:
+                serializer = HabitSerializer(data=record, context=context)
+                if serializer.is_valid():
+                    valid.append({**serializer.validated_data,
+                                  'owner': owner})
+                    continue
+                errors = serializer.errors
+            report['failed'] += 1
+            if len(report['errors']) < settings.HABIT_IMPORT_MAX_ERRORS:
+                report['errors'].append({'row': row, 'errors': errors})
+        if valid:
+            HabitSerializer(many=True).create(valid)
+            report['created'] += len(valid)
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from habit_tracker.models import Habit
+
+
+class Command(BaseCommand):
+    """A custom command for computing next occurrence of existing habits"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute next occurrence of all habits')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        habits = Habit.objects.only('period', 'created_on', 'next_due')
+        # Only habits without schedule are updated by default
+        if not options['all']:
+            habits = habits.filter(next_due__isnull=True)
+        batch = []
+        total = 0
+        for habit in habits.order_by('pk').iterator(chunk_size=batch_size):
+            habit.update_next_due()
+            batch.append(habit)
+            if len(batch) == batch_size:
+                total += Habit.objects.bulk_update(batch, ['next_due'])
+                batch = []
+        total += Habit.objects.bulk_update(batch, ['next_due'])
+        self.stdout.write(f'Updated {total} habits')
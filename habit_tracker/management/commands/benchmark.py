@@ -0,0 +1,86 @@
+import json
+import platform
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+from django.utils import timezone
+
+from config.benchmark import compare, run_benchmark
+
+
+class Command(BaseCommand):
+    """
+    A custom command for measuring latency, throughput and queries of API
+    endpoints and duration of Celery tasks on a temporary database
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--habits', type=int, default=20,
+                            help='Number of habits of each user')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Number of requests to each endpoint')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Number of requests in flight to async '
+                                 'endpoint')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Latency of stub Telegram server in '
+                                 'seconds')
+        parser.add_argument('--label', default='',
+                            help='Label of run, e.g. commit hash')
+        parser.add_argument('--output', help='File to write results to')
+        parser.add_argument('--compare',
+                            help='File with results of a previous run')
+        parser.add_argument('--configured-cache', action='store_true',
+                            help='Use configured cache instead of local '
+                                 'memory cache')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(error)
+        caches = {} if options['configured_cache'] else {'CACHES': {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }
+        }}
+        # Data is seeded into a temporary test database
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**caches):
+                results = run_benchmark(
+                    options['users'], options['habits'], options['requests'],
+                    options['concurrency'], options['latency'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        results['meta'] = {
+            'label': options['label'],
+            'created': timezone.now().isoformat(),
+            'users': options['users'],
+            'habits': options['habits'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'latency': options['latency'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if baseline is not None:
+            for name, metric, before, after, change in compare(baseline,
+                                                               results):
+                self.stderr.write(f'{name} {metric}: {before:.2f} -> '
+                                  f'{after:.2f} ({change:+.1%})')
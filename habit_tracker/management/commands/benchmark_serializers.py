@@ -0,0 +1,57 @@
+import datetime
+import json
+import timeit
+
+from django.core.management import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import FastJSONRenderer
+from habit_tracker.models import Habit
+from habit_tracker.serializers import HabitSerializer, \
+    habit_values_serializer
+
+
+class Command(BaseCommand):
+    """
+    A custom command for comparing cost of habit list serialization by
+    `HabitSerializer` and by the fast read path
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=1000,
+                            help='Number of habits in a single list')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        count, repeat = options['habits'], options['repeat']
+        # Serialization does not touch database, so rows are built in memory
+        today = datetime.date.today()
+        rows = [
+            {'id': pk, 'place': 'home', 'action': f'action {pk}',
+             'time': datetime.time(7, pk % 60), 'is_pleasant': False,
+             'is_public': True, 'exec_time': 60, 'period': 1,
+             'award': None, 'created_on': today,
+             'associated_habit_id': None, 'owner_id': 1}
+            for pk in range(count)
+        ]
+        habits = [Habit(**row) for row in rows]
+
+        def serializer_path():
+            data = HabitSerializer(habits, many=True).data
+            return JSONRenderer().render(data)
+
+        def fast_path():
+            data = habit_values_serializer.to_representation(rows)
+            return FastJSONRenderer().render(data)
+
+        # Both paths must render the same document
+        if json.loads(serializer_path()) != json.loads(fast_path()):
+            raise AssertionError('Representations are different')
+        results = {}
+        for name, path in (('serializer', serializer_path),
+                           ('fast', fast_path)):
+            seconds = min(timeit.repeat(path, number=1, repeat=repeat))
+            results[name] = seconds / count * 1e6
+            self.stdout.write(f'{name}: {results[name]:.2f} us per habit')
+        self.stdout.write(
+            f'speedup: {results["serializer"] / results["fast"]:.1f}x')
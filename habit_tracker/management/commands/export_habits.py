@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand, CommandError
+
+from habit_tracker.export import ENCODERS, export_habits
+from habit_tracker.models import Habit
+
+
+class Command(BaseCommand):
+    """A custom command for exporting habits of all or selected users"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=ENCODERS, default='ndjson',
+                            help='Format of exported habits')
+        parser.add_argument('--output', help='File to write habits to, '
+                                             'standard output by default')
+        parser.add_argument('--user', action='append', default=[],
+                            help='Email of user whose habits are exported')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.all()
+        if options['user']:
+            habits = habits.filter(owner__email__in=options['user'])
+        chunks = export_habits(habits, options['type'],
+                               options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        try:
+            with open(options['output'], 'w', newline='') as file:
+                file.writelines(chunks)
+        except OSError as error:
+            raise CommandError(error)
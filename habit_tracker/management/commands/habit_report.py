@@ -0,0 +1,34 @@
+import json
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from habit_tracker.analytics import get_global_stats
+
+
+class Command(BaseCommand):
+    """
+    A custom command for statistics of habits of all users. Only shards of
+    users whose habits changed since the previous report are counted again
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true',
+                            help='Count habits of all shards again')
+        parser.add_argument('--output', help='File to write report to, '
+                                             'standard output by default')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        report = json.dumps(get_global_stats(refresh=options['refresh']),
+                            indent=2)
+        if not options['output']:
+            self.stdout.write(report)
+        else:
+            try:
+                with open(options['output'], 'w') as file:
+                    file.write(report + '\n')
+            except OSError as error:
+                raise CommandError(error)
+        self.stderr.write(f'Report is ready in '
+                          f'{time.perf_counter() - started:.2f}s')
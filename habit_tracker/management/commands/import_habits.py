@@ -0,0 +1,41 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from habit_tracker.imports import PARSERS, import_habits
+from users.models import User
+
+
+class Command(BaseCommand):
+    """A custom command for importing habits of user from file"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File of habits')
+        parser.add_argument('--user', required=True,
+                            help='Email of owner of imported habits')
+        parser.add_argument('--type', choices=PARSERS,
+                            help='Format of file, taken from its extension '
+                                 'by default')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+        import_format = options['type'] or \
+            options['path'].rsplit('.', 1)[-1].lower()
+        if import_format not in PARSERS:
+            raise CommandError('Type of file cannot be identified')
+        try:
+            with open(options['path'], encoding='utf-8-sig',
+                      newline='') as file:
+                report = import_habits(file, import_format, owner,
+                                       options['batch_size'])
+        except OSError as error:
+            raise CommandError(error)
+        for error in report['errors']:
+            self.stderr.write(f'Row {error["row"]}: '
+                              f'{json.dumps(error["errors"])}')
+        self.stdout.write(f'Created {report["created"]} habits, '
+                          f'{report["failed"]} rows failed')
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:02
+
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.db import migrations, models
+
+
+def fill_reminder_slots(apps, schema_editor):
+    """Compute reminder slots of existing habits"""
+    Habit = apps.get_model('habit_tracker', 'Habit')
+    today = datetime.date.today()
+    habits = []
+    for habit in Habit.objects.select_related('owner').iterator(
+            chunk_size=2000):
+        timezone = habit.owner.timezone if habit.owner else 'Europe/Moscow'
+        local = datetime.datetime.combine(today, habit.time,
+                                          tzinfo=ZoneInfo(timezone))
+        utc = local.astimezone(datetime.timezone.utc)
+        habit.reminder_slot = utc.hour * 60 + utc.minute
+        habits.append(habit)
+    Habit.objects.bulk_update(habits, ['reminder_slot'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_timezone'),
+        ('habit_tracker', '0005_habit_created_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='reminder_slot',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='reminder_slot'),
+        ),
+        migrations.RunPython(fill_reminder_slots, migrations.RunPython.noop),
+    ]
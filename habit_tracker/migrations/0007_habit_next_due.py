@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit_tracker', '0006_habit_reminder_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_due',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='next_due'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit_tracker', '0007_habit_next_due'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['owner', 'time', 'id'], name='habit_public_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('habit_tracker', '0008_habit_habit_public_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='habit',
+            options={'verbose_name': 'habit', 'verbose_name_plural': 'habits'},
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='next_due',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='next_due'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='owner'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='reminder_slot',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='reminder_slot'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'time', 'id'], name='habit_owner_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['next_due', 'owner'], name='habit_next_due_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasant', False)), fields=['reminder_slot'], name='habit_reminder_slot_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-18 13:03
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit_tracker', '0009_habit_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='habit_tracker.habit', verbose_name='habit')),
+                ('done_count', models.PositiveIntegerField(default=0, verbose_name='done_count')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='current_streak')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='longest_streak')),
+                ('last_done_on', models.DateField(blank=True, null=True, verbose_name='last_done_on')),
+            ],
+            options={
+                'verbose_name': 'habit statistics',
+                'verbose_name_plural': 'habit statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'done'), (2, 'skipped')], default=1, verbose_name='status')),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habit_tracker.habit', verbose_name='habit')),
+            ],
+            options={
+                'verbose_name': 'habit completion',
+                'verbose_name_plural': 'habit completions',
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='habit_completion_date_brin')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='habitcompletion',
+            constraint=models.UniqueConstraint(fields=('habit', 'date'), name='habit_completion_habit_date_uniq'),
+        ),
+    ]
@@ -1,8 +1,66 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.db.models import ExpressionWrapper, F
+from django.db.models.expressions import RawSQL
 
 from users.models import User, NULLABLE
 
 
+class HabitQuerySet(models.QuerySet):
+    """
+    Custom queryset for model `habit_tracker.Habit`
+    """
+
+    def due_on(self, date):
+        """
+        Filters habits which should be done on the given date using indexed
+        date of the next occurrence
+        """
+        return self.filter(next_due=date)
+
+    def advance(self):
+        """
+        Moves habits which have been notified about to their next occurrence
+        """
+        return self.update(next_due=ExpressionWrapper(
+            F('next_due') + F('period'), output_field=models.DateField()
+        ))
+
+    def catch_up(self, date):
+        """
+        Moves habits with missed occurrences before the given date to their
+        next occurrence on or after this date by a single query, so habits
+        are not loaded however many of them are behind
+        """
+        # Difference of dates is the number of days in PostgreSQL and
+        # division of integers is rounded down
+        return self.filter(next_due__lt=date).update(next_due=RawSQL(
+            'next_due + (%s::date - next_due + period - 1) / period * period',
+            (date,), output_field=models.DateField(),
+        ))
+
+    def refresh_reminder_slots(self, batch_size=2000):
+        """
+        Recomputes reminder slots of habits, e.g. after change of owner's
+        time zone or daylight saving time
+        """
+        changed = []
+        habits = self.select_related('owner').only(
+            'time', 'reminder_slot', 'owner', 'owner__timezone'
+        ).order_by('pk')
+        for habit in habits.iterator(chunk_size=batch_size):
+            slot = habit.reminder_slot
+            habit.update_reminder_slot()
+            if habit.reminder_slot != slot:
+                changed.append(habit)
+        self.model.objects.bulk_update(changed, ['reminder_slot'],
+                                       batch_size=batch_size)
+        return len(changed)
+
+
 class Habit(models.Model):
     """
     Stores a single habit entry.
@@ -22,16 +80,174 @@ class Habit(models.Model):
     associated_habit = models.ForeignKey("Habit", on_delete=models.SET_NULL,
                                          **NULLABLE,
                                          verbose_name='related_habit')
+    # Owner is indexed by composite indexes of model
     owner = models.ForeignKey(User, on_delete=models.CASCADE,
-                              verbose_name='owner', **NULLABLE)
+                              verbose_name='owner', db_index=False,
+                              **NULLABLE)
 
     # Add date of habit creation
     created_on = models.DateField(auto_now_add=True, verbose_name='created_on')
+    # Minute of the day (UTC) when habit should be done, used for reminders
+    reminder_slot = models.PositiveSmallIntegerField(
+        editable=False, verbose_name='reminder_slot', **NULLABLE
+    )
+    # Date of the next occurrence of habit
+    next_due = models.DateField(editable=False, verbose_name='next_due',
+                                **NULLABLE)
+
+    objects = HabitQuerySet.as_manager()
+
+    # Visibility of habit when it was loaded from database
+    was_public = False
 
     def __str__(self):
         return f'I will {self.action} at {self.time} in {self.place}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember visibility of habit loaded from database"""
+        instance = super().from_db(db, field_names, values)
+        # Deferred field is considered public to be on the safe side
+        instance.was_public = instance.__dict__.get('is_public', True)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Compute reminder slot and next occurrence before each save"""
+        self.update_reminder_slot()
+        self.update_next_due()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'],
+                                       'reminder_slot', 'next_due'}
+        super().save(*args, **kwargs)
+        self.was_public = self.is_public
+
+    def next_occurrence(self, date):
+        """Find the first date on or after the given one when habit is due"""
+        created_on = self.created_on or datetime.date.today()
+        return date + datetime.timedelta(
+            days=-(date - created_on).days % self.period
+        )
+
+    def update_next_due(self):
+        """
+        Set date of the next occurrence. Occurrence which has already been
+        notified about is kept in the future
+        """
+        today = datetime.date.today()
+        self.next_due = self.next_occurrence(
+            max(today, self.next_due or today)
+        )
+
+    def update_reminder_slot(self, timezone=None):
+        """
+        Convert local time of habit in owner's time zone to the minute of
+        the day in UTC
+        """
+        if timezone is None:
+            timezone = self.owner.timezone if self.owner_id else \
+                User._meta.get_field('timezone').default
+        habit_time = self._meta.get_field('time').to_python(self.time)
+        # Time zone offset is taken for today's date
+        local = datetime.datetime.combine(datetime.date.today(), habit_time,
+                                          tzinfo=ZoneInfo(timezone))
+        utc = local.astimezone(datetime.timezone.utc)
+        self.reminder_slot = utc.hour * 60 + utc.minute
+
+    def is_due(self, date):
+        """Check if habit should be done on the given date"""
+        return self.next_occurrence(date) == date
+
     class Meta:
         verbose_name = 'habit'
         verbose_name_plural = 'habits'
-        ordering = ('owner',)
+        indexes = [
+            # Habits of user are ordered by time
+            models.Index(fields=['owner', 'time', 'id'],
+                         name='habit_owner_time_idx'),
+            # Public feed is ordered by owner and time
+            models.Index(fields=['owner', 'time', 'id'],
+                         condition=models.Q(is_public=True),
+                         name='habit_public_feed_idx'),
+            # Habits due on date are fetched for chunks of users
+            models.Index(fields=['next_due', 'owner'],
+                         name='habit_next_due_owner_idx'),
+            # Only useful habits are reminded about
+            models.Index(fields=['reminder_slot'],
+                         condition=models.Q(is_pleasant=False),
+                         name='habit_reminder_slot_idx'),
+        ]
+
+
+class CompletionStatus(models.IntegerChoices):
+    DONE = 1, 'done'
+    SKIPPED = 2, 'skipped'
+
+
+class HabitCompletion(models.Model):
+    """
+    Stores whether habit was done on a single date. Entries are only
+    appended, statistics of habit are updated on each append
+    """
+    # Habit is indexed by unique constraint of model
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE,
+                              related_name='completions', db_index=False,
+                              verbose_name='habit')
+    date = models.DateField(verbose_name='date')
+    status = models.PositiveSmallIntegerField(
+        choices=CompletionStatus.choices, default=CompletionStatus.DONE,
+        verbose_name='status'
+    )
+
+    class Meta:
+        verbose_name = 'habit completion'
+        verbose_name_plural = 'habit completions'
+        constraints = [
+            # A single entry per day, log of habit is read by date range
+            models.UniqueConstraint(fields=['habit', 'date'],
+                                    name='habit_completion_habit_date_uniq'),
+        ]
+        indexes = [
+            # Entries are appended in order of dates, so a tiny block range
+            # index is enough to scan all habits by dates
+            BrinIndex(fields=['date'], name='habit_completion_date_brin'),
+        ]
+
+
+class HabitStats(models.Model):
+    """
+    Stores statistics of habit updated incrementally by appended
+    completions, so they are never computed by scanning the log
+    """
+    habit = models.OneToOneField(Habit, on_delete=models.CASCADE,
+                                 primary_key=True, related_name='stats',
+                                 verbose_name='habit')
+    done_count = models.PositiveIntegerField(default=0,
+                                             verbose_name='done_count')
+    # Number of occurrences done in a row, each within period of previous
+    current_streak = models.PositiveIntegerField(
+        default=0, verbose_name='current_streak')
+    longest_streak = models.PositiveIntegerField(
+        default=0, verbose_name='longest_streak')
+    last_done_on = models.DateField(verbose_name='last_done_on', **NULLABLE)
+
+    class Meta:
+        verbose_name = 'habit statistics'
+        verbose_name_plural = 'habit statistics'
+
+    def add(self, date, period):
+        """Count habit done on date which is later than all previous ones"""
+        if self.last_done_on is not None \
+                and (date - self.last_done_on).days <= period:
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.last_done_on = date
+        self.done_count += 1
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+
+    def recompute(self, dates, period):
+        """Compute statistics from all dates when habit was done"""
+        self.done_count = self.current_streak = self.longest_streak = 0
+        self.last_done_on = None
+        for date in sorted(dates):
+            self.add(date, period)
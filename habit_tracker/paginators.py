@@ -1,4 +1,21 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def is_keyset_requested(request):
+    """
+    Check if client requests keyset pagination by `?pagination=cursor`
+    or by cursor of the previous page
+    """
+    return (KeysetPaginator.cursor_query_param in request.query_params
+            or request.query_params.get('pagination') == 'cursor')
 
 
 class DefaultPaginator(PageNumberPagination):
@@ -8,3 +25,151 @@ class DefaultPaginator(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class KeysetPaginator(CursorPagination):
+    """
+    Keyset pagination by the whole ordering `(owner, time, id)`. Cursor
+    stores values of the last row of page, so every page is fetched by an
+    indexed range query without COUNT and OFFSET
+    """
+    ordering = ('owner', 'time', 'id')
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Compose query of the requested page. Page is fetched with one extra
+        row to find out if more rows exist
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [queryset.model._meta.get_field(name)
+                       for name in self.ordering]
+        self.position, self.reverse = self.decode_cursor(request)
+        # Previous page is fetched in reversed ordering
+        ordering = [('-' if self.reverse else '') + name
+                    for name in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Take page from rows fetched by query of `get_page_queryset`"""
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        has_position = self.position is not None
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = has_position, has_more
+        else:
+            self.has_next, self.has_previous = has_more, has_position
+        return self.page
+
+    def get_keyset_filter(self, position):
+        """
+        Compose filter of rows following position in the current ordering
+        """
+        keyset_filter = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.fields, position):
+            keyset_filter |= equal & self.get_field_filter(field, value)
+            equal &= Q(**{f'{field.attname}__isnull': True}) \
+                if value is None else Q(**{field.attname: value})
+        return keyset_filter
+
+    def get_field_filter(self, field, value):
+        """
+        Compose filter of values following value of a single field. NULL
+        values are the last ones in ascending ordering
+        """
+        if self.reverse:
+            if value is None:
+                return Q(**{f'{field.attname}__isnull': False})
+            return Q(**{f'{field.attname}__lt': value})
+        if value is None:
+            return Q(pk__in=[])
+        greater = Q(**{f'{field.attname}__gt': value})
+        if field.null:
+            greater |= Q(**{f'{field.attname}__isnull': True})
+        return greater
+
+    def get_position(self, instance):
+        """Get values of ordering fields of a single row"""
+        position = []
+        for field in self.fields:
+            # Rows are either model instances or dictionaries of values
+            if isinstance(instance, dict):
+                value = instance[field.attname]
+            else:
+                value = getattr(instance, field.attname)
+            # Time and date values are stored in ISO format
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def decode_cursor(self, request):
+        """Get position and direction from cursor of request"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse = bool(data['r'])
+            if len(data['p']) != len(self.fields):
+                raise ValueError
+            position = [None if value is None else field.to_python(value)
+                        for field, value in zip(self.fields, data['p'])]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        """Compose URL with cursor pointing to a single row"""
+        data = json.dumps({'p': self.get_position(instance),
+                           'r': int(reverse)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+async def apaginate_queryset(paginator, queryset, request):
+    """
+    Paginate queryset like `paginate_queryset` of paginator, but rows and
+    the number of rows are fetched by async queries
+    """
+    if isinstance(paginator, KeysetPaginator):
+        queryset = paginator.get_page_queryset(queryset, request)
+        return paginator.set_page([row async for row in queryset])
+    page_size = paginator.get_page_size(request)
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    # Number of rows is cached by paginator
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(
+            page_number=page_number, message=str(exc)))
+    paginator.page.object_list = [
+        row async for row in paginator.page.object_list
+    ]
+    paginator.request = request
+    return list(paginator.page)
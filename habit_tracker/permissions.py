@@ -5,4 +5,8 @@ class IsOwner(BasePermission):
     message = "You are not an owner of this entity"
 
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.owner
+        # Owner is compared by ID to avoid loading it. Habits without owner
+        # are not accessible, as anonymous user has no ID either
+        return (request.user.is_authenticated
+                and obj.owner_id is not None
+                and obj.owner_id == request.user.pk)
@@ -1,16 +1,161 @@
+import datetime
+
+from django.db import models, transaction
+from django.db.models import Q
 from rest_framework import serializers
 
-from habit_tracker.models import Habit
+from habit_tracker import cache
+from habit_tracker.completions import get_occurrences
+from habit_tracker.models import CompletionStatus, Habit, HabitStats
+
+
+def get_referable_habits(user):
+    """
+    Habits which user can use as associated ones: own and public habits
+    """
+    if user is None or not user.is_authenticated:
+        return Habit.objects.filter(is_public=True)
+    return Habit.objects.filter(Q(owner=user) | Q(is_public=True))
+
+
+def get_related_habits(items, user):
+    """
+    Fetch associated habits of all items of bulk request by a single query.
+    Only habits which user can refer to are fetched
+    """
+    ids = set()
+    for item in items:
+        if isinstance(item, dict) and item.get('associated_habit'):
+            try:
+                ids.add(int(item['associated_habit']))
+            except (TypeError, ValueError):
+                # Error is reported by serializer field
+                pass
+    return get_referable_habits(user).in_bulk(ids)
+
+
+class AssociatedHabitField(serializers.PrimaryKeyRelatedField):
+    """
+    Related field which takes habits prefetched for bulk requests from
+    `related_habits` of serializer context. Other users' private habits
+    cannot be associated
+    """
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        return get_referable_habits(getattr(request, 'user', None))
+
+    def to_internal_value(self, data):
+        related_habits = self.context.get('related_habits')
+        if related_habits is None:
+            return super().to_internal_value(data)
+        try:
+            return related_habits[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class HabitListSerializer(serializers.ListSerializer):
+    """
+    Serializer for lists of `habit_tracker.Habit` which saves all habits by
+    a single query
+    """
+
+    def create(self, validated_data):
+        """Insert all habits by a single query"""
+        habits = [Habit(**attrs) for attrs in validated_data]
+        for habit in habits:
+            habit.update_reminder_slot()
+            habit.update_next_due()
+        with transaction.atomic():
+            Habit.objects.bulk_create(habits)
+        invalidate_habits(habits)
+        return habits
+
+    def update(self, instances, validated_data):
+        """
+        Update all habits by a single query. Validated data is the list of
+        changes for each instance
+        """
+        fields = {'reminder_slot', 'next_due'}
+        for habit, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(habit, attr, value)
+                fields.add(attr)
+            habit.update_reminder_slot()
+            habit.update_next_due()
+        with transaction.atomic():
+            Habit.objects.bulk_update(instances, fields)
+        invalidate_habits(instances)
+        return instances
+
+
+def invalidate_habits(habits):
+    """
+    Invalidate cached lists after habits were saved without signals
+    """
+    for owner_id in {habit.owner_id for habit in habits if habit.owner_id}:
+        cache.invalidate(owner_id)
+    if any(habit.is_public or habit.was_public for habit in habits):
+        cache.invalidate_public()
+
+
+def get_expand(request):
+    """
+    Get set of related fields which client asks to inline by
+    `?expand=associated_habit`
+    """
+    expand = request.query_params.get('expand', '')
+    return set(expand.split(',')) & set(HabitSerializer.Meta.expandable)
 
 
 class HabitSerializer(serializers.ModelSerializer):
     """
     Serializer for model `habit_tracker.Habit`
     """
+    associated_habit = AssociatedHabitField(allow_null=True, required=False)
 
     class Meta:
         model = Habit
-        fields = '__all__'
+        fields = ('id', 'place', 'action', 'time', 'is_pleasant',
+                  'is_public', 'exec_time', 'period', 'award', 'created_on',
+                  'associated_habit', 'owner')
+        list_serializer_class = HabitListSerializer
+        # Related fields which can be inlined into representation
+        expandable = ('associated_habit',)
+
+    @classmethod
+    def setup_queryset(cls, queryset, expand=()):
+        """
+        Load only serialized fields and join associated habit if it is
+        inlined, so the number of queries does not depend on the number of
+        habits
+        """
+        fields = list(cls.Meta.fields)
+        if 'associated_habit' not in expand:
+            return queryset.only(*fields)
+        fields += [f'associated_habit__{name}' for name in cls.Meta.fields]
+        return queryset.select_related('associated_habit').only(*fields)
+
+    def to_representation(self, instance):
+        """
+        Inline associated habit if client asks for it. Private habit is
+        inlined only for its owner given by `viewer` of context, otherwise
+        only its ID is represented
+        """
+        data = super().to_representation(instance)
+        if 'associated_habit' in self.context.get('expand', ()) \
+                and instance.associated_habit_id:
+            associated_habit = instance.associated_habit
+            viewer = self.context.get('viewer')
+            if associated_habit.is_public or (
+                    viewer is not None
+                    and associated_habit.owner_id == viewer):
+                data['associated_habit'] = HabitSerializer(
+                    associated_habit).data
+        return data
 
     def validate_period(self, value):
         """
@@ -81,3 +226,113 @@ class HabitSerializer(serializers.ModelSerializer):
                 "The pleasant habit cannot have award")
 
         return data
+
+
+class CompletionStatusField(serializers.ChoiceField):
+    """Status of completion represented by its name"""
+
+    def __init__(self, **kwargs):
+        super().__init__(choices=[label for _, label in
+                                  CompletionStatus.choices], **kwargs)
+
+    def to_internal_value(self, data):
+        return CompletionStatus[super().to_internal_value(data).upper()]
+
+    def to_representation(self, value):
+        return CompletionStatus(value).label
+
+
+class HabitCompletionSerializer(serializers.Serializer):
+    """
+    Serializer for a single completion of habit. Habit is done today
+    unless date is given
+    """
+    habit = serializers.IntegerField()
+    date = serializers.DateField(default=datetime.date.today)
+    status = CompletionStatusField(default=CompletionStatus.DONE)
+
+    def validate_date(self, value):
+        """
+        Validates date of completion
+        """
+        # Date in time zone of user can be a day ahead of server
+        if value > datetime.date.today() + datetime.timedelta(days=1):
+            raise serializers.ValidationError(
+                "Habit cannot be done in the future")
+        return value
+
+
+class CompletionRangeSerializer(serializers.Serializer):
+    """Serializer for range of dates of completion log"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+
+class HabitStatsSerializer(serializers.ModelSerializer):
+    """
+    Serializer for model `habit_tracker.HabitStats`. Habit of statistics
+    should be loaded, since current streak and completion rate depend on
+    its period and creation date
+    """
+    current_streak = serializers.SerializerMethodField()
+    completion_rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = HabitStats
+        fields = ('habit', 'done_count', 'current_streak', 'longest_streak',
+                  'last_done_on', 'completion_rate')
+
+    def get_current_streak(self, obj):
+        """Streak is broken once the next occurrence was missed"""
+        if obj.last_done_on is None or (
+                datetime.date.today() - obj.last_done_on).days \
+                > obj.habit.period:
+            return 0
+        return obj.current_streak
+
+    def get_completion_rate(self, obj):
+        """Part of occurrences of habit since its creation which were done"""
+        occurrences = get_occurrences(obj.habit)
+        if not occurrences:
+            return 0
+        return round(min(obj.done_count / occurrences, 1), 4)
+
+
+class HabitValuesSerializer:
+    """
+    Read-only serializer of habits from `.values()` rows. Representation is
+    the same as of `HabitSerializer`, but neither model instances nor
+    serializer fields are created for each habit
+    """
+
+    def __init__(self):
+        # Precompiled mapping of representation keys to row keys
+        self.mapping = []
+        for name in HabitSerializer.Meta.fields:
+            field = Habit._meta.get_field(name)
+            # Dates and times are represented in ISO 8601 format
+            convert = isoformat if isinstance(
+                field, (models.DateField, models.TimeField)) else None
+            self.mapping.append((name, field.attname, convert))
+        self.attnames = [attname for _, attname, _ in self.mapping]
+
+    def get_values(self, queryset):
+        """Fetch only serialized columns as dictionaries"""
+        return queryset.values(*self.attnames)
+
+    def to_representation(self, rows):
+        """Serialize list of rows"""
+        mapping = self.mapping
+        return [
+            {name: convert(row[attname]) if convert else row[attname]
+             for name, attname, convert in mapping}
+            for row in rows
+        ]
+
+
+def isoformat(value):
+    """Represent date or time in ISO 8601 format"""
+    return None if value is None else value.isoformat()
+
+
+habit_values_serializer = HabitValuesSerializer()
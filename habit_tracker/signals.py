@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from habit_tracker import cache
+from habit_tracker.models import Habit
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def refresh_user_reminder_slots(sender, instance, created, update_fields,
+                                **kwargs):
+    """
+    Recompute reminder slots of user's habits when time zone is changed.
+    Time zone of user which was not loaded is considered changed
+    """
+    if created:
+        return
+    if update_fields is not None and 'timezone' not in update_fields:
+        return
+    if instance.loaded_timezone is not None \
+            and instance.timezone == instance.loaded_timezone:
+        return
+    Habit.objects.filter(owner=instance).refresh_reminder_slots()
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_habit_list(sender, instance, **kwargs):
+    """
+    Invalidate cached habit list of owner after habit is changed
+    """
+    if instance.owner_id:
+        cache.invalidate(instance.owner_id)
+    else:
+        cache.invalidate_shard(cache.get_shard(None))
+    # Public feed is changed if habit is or was public
+    if instance.is_public or instance.was_public:
+        cache.invalidate_public()
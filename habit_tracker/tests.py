@@ -1,9 +1,36 @@
+import csv
 import datetime
+import json
+import tempfile
+import time
+from io import StringIO
 
+from asgiref.sync import sync_to_async
+from django.core.cache import cache as django_cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.request import Request
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from habit_tracker.models import Habit
+from config import celery_app, metrics
+from config.benchmark import compare, measure, run_benchmark
+from config.middleware import ConcurrencyLimitMiddleware
+from config.services import AsyncTelegramSender, get_sender, \
+    iter_digests, iter_reminders, SharedTokenBucket, TelegramSender, \
+    TokenBucket
+from config.tasks import send_notifications, send_notifications_chunk
+from config.telegram_stub import TelegramStubServer
+from config.throttling import UserRateThrottle
+from habit_tracker.models import Habit, HabitCompletion, HabitStats
+from habit_tracker.serializers import HabitSerializer, \
+    habit_values_serializer
 from users.models import User
 
 
@@ -166,6 +193,20 @@ class HabitTest(APITestCase):
             Habit.objects.exists()
         )
 
+    def test_ownerless_habit(self):
+        """Testing that anonymous user cannot access habit without owner"""
+        self.habit.owner = None
+        self.habit.save()
+        url = f'/habits/{self.habit.pk}/'
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        response = self.client.patch(url, {'place': 'place2'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.delete(url).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.place, 'place1')
+
     def test_habit_list(self):
         """Testing list of habits"""
         # Authenticate user without token
@@ -196,6 +237,164 @@ class HabitTest(APITestCase):
             }
         )
 
+    def test_habit_list_cache(self):
+        """Testing cached list of habits"""
+        # Authenticate user without token
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/habits/')
+        # Second request is served from cache without database queries
+        with self.assertNumQueries(0):
+            cached_response = self.client.get('/habits/')
+        self.assertEqual(response.json(), cached_response.json())
+        # Cache is invalidated after habit update
+        self.client.patch(f'/habits/{self.habit.pk}/',
+                          data={'action': 'new action'})
+        response = self.client.get('/habits/')
+        self.assertEqual(response.json()['results'][0]['action'],
+                         'new action')
+        # Cache is invalidated after habit deletion
+        self.habit.delete()
+        self.assertEqual(self.client.get('/habits/').json()['count'], 0)
+
+    def test_habit_list_keyset(self):
+        """Testing keyset pagination of habit list"""
+        # Authenticate user without token
+        self.client.force_authenticate(self.user)
+        # Create habits with the same time to check ordering by ID
+        for hour in (6, 7, 7, 8, 9, 9):
+            Habit.objects.create(
+                place='place', action=f'action{hour}', time=f'{hour:02}:00',
+                is_pleasant=False, is_public=False, exec_time=60,
+                owner=self.user,
+            )
+        expected = list(Habit.objects.filter(owner=self.user).order_by(
+            'time', 'id').values_list('id', flat=True))
+        # Walk through all pages by next links
+        ids = []
+        url = '/habits/?pagination=cursor&page_size=3'
+        while url:
+            response = self.client.get(url).json()
+            self.assertNotIn('count', response)
+            ids += [habit['id'] for habit in response['results']]
+            url = response['next']
+        self.assertEqual(ids, expected)
+        # Previous link of the last page leads to the previous page
+        response = self.client.get(response['previous']).json()
+        self.assertEqual([habit['id'] for habit in response['results']],
+                         expected[3:6])
+        # Invalid cursor is rejected
+        response = self.client.get('/habits/?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_public_list_keyset(self):
+        """Testing keyset pagination of public habits"""
+        response = self.client.get('/habits/public/?pagination=cursor')
+        self.assertEqual(
+            [habit['id'] for habit in response.json()['results']],
+            [self.habit.pk]
+        )
+
+    def test_public_list(self):
+        """Testing paginated and cached public feed"""
+        response = self.client.get('/habits/public/')
+        self.assertEqual(response.json()['count'], 1)
+        # Client receives `304 Not Modified` for unchanged feed
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                '/habits/public/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        # Feed is invalidated after public habit becomes private
+        time.sleep(0.002)
+        self.habit.is_public = False
+        self.habit.save()
+        response = self.client.get(
+            '/habits/public/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_habit_list_expand(self):
+        """Testing inlined associated habits in habit list"""
+        # Authenticate user without token
+        self.client.force_authenticate(self.user)
+        pleasant = Habit.objects.create(
+            place='home', action='rest', time='08:00', is_pleasant=True,
+            is_public=False, exec_time=60, owner=self.user,
+        )
+        for _ in range(10):
+            Habit.objects.create(
+                place='home', action='work', time='09:00',
+                is_pleasant=False, is_public=False, exec_time=60,
+                owner=self.user, associated_habit=pleasant,
+            )
+        # Number of queries does not depend on page size
+        for page_size in (2, 10):
+            with self.assertNumQueries(1):
+                response = self.client.get(
+                    '/habits/?pagination=cursor&expand=associated_habit'
+                    f'&page_size={page_size}'
+                )
+        habit = response.json()['results'][-1]
+        self.assertEqual(habit['associated_habit']['id'], pleasant.pk)
+        self.assertEqual(habit['associated_habit']['action'], 'rest')
+        # Associated habit is not joined unless it is inlined
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/habits/?pagination=cursor&page_size=3')
+        self.assertNotIn('JOIN', queries[0]['sql'])
+
+    def test_private_associated_habit(self):
+        """
+        Testing that private habits of other users can be neither associated
+        nor inlined into public feed
+        """
+        other = User.objects.create(email='other@gmail.com')
+        private = Habit.objects.create(
+            place='home', action='secret', time='08:00', is_pleasant=True,
+            is_public=False, exec_time=60, owner=other,
+        )
+        self.client.force_authenticate(self.user)
+        data = {'place': 'home', 'action': 'work', 'time': '09:00',
+                'is_pleasant': False, 'is_public': True, 'exec_time': 60,
+                'associated_habit': private.pk}
+        response = self.client.post('/habits/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('associated_habit', response.json())
+        response = self.client.post('/habits/bulk/', [data], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Habit which became private is represented by its ID
+        private.is_public = True
+        private.save()
+        response = self.client.post('/habits/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pk = response.json()['id']
+        private.is_public = False
+        private.save()
+        self.client.force_authenticate(None)
+        response = self.client.get('/habits/public/',
+                                   {'expand': 'associated_habit'})
+        habits = {habit['id']: habit for habit in response.json()['results']}
+        self.assertEqual(habits[pk]['associated_habit'], private.pk)
+        # Owner of private habit sees it inlined into own list
+        Habit.objects.filter(pk=pk).update(owner=other)
+        self.client.force_authenticate(other)
+        response = self.client.get('/habits/', {'expand': 'associated_habit'})
+        habits = {habit['id']: habit for habit in response.json()['results']}
+        self.assertEqual(habits[pk]['associated_habit']['action'], 'secret')
+
+    def test_values_serializer(self):
+        """Testing that fast read path represents habits as serializer"""
+        Habit.objects.create(
+            place='place2', action='action2', time='08:30:15',
+            is_pleasant=True, is_public=False, exec_time=30, period=3,
+            award='award', owner=self.user,
+        )
+        queryset = Habit.objects.order_by('pk')
+        self.assertEqual(
+            habit_values_serializer.to_representation(
+                habit_values_serializer.get_values(queryset)),
+            HabitSerializer(queryset, many=True).data
+        )
+
     def test_habit_print(self):
         """Testing string representation of habit model"""
         self.assertEqual(
@@ -434,3 +633,1303 @@ class HabitTest(APITestCase):
                 ]
             }
         )
+
+
+class NotificationTest(APITestCase):
+    """
+    Class for testing daily digest of habits
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        # Execute Celery tasks locally
+        celery_app.conf.task_always_eager = True
+        self.today = datetime.date.today()
+        # Create users with and without Telegram ID
+        self.users = [
+            User.objects.create(email=f'user{i}@gmail.com', telegram_id=i)
+            for i in range(1, 4)
+        ]
+        User.objects.create(email='no_telegram@gmail.com')
+        # Create habits for each user
+        for user in self.users:
+            for period in (1, 2, 3):
+                Habit.objects.create(
+                    place='home', action=f'action{period}', time='07:00',
+                    is_pleasant=False, is_public=False, exec_time=60,
+                    period=period, owner=user,
+                )
+            Habit.objects.create(
+                place='home', action='pleasant', time='08:00',
+                is_pleasant=True, is_public=False, exec_time=60,
+                period=1, owner=user,
+            )
+
+    def tearDown(self):
+        celery_app.conf.task_always_eager = False
+
+    def test_due_on(self):
+        """Testing filter of habits which are due on date"""
+        # Shift creation date of all habits back by two days
+        Habit.objects.update(
+            created_on=self.today - datetime.timedelta(days=2),
+            next_due=None,
+        )
+        # Compute next occurrence of existing habits
+        call_command('backfill_next_due', stdout=StringIO())
+        # Only habits with period 1 and 2 are due today
+        self.assertEqual(
+            set(Habit.objects.due_on(self.today).filter(
+                is_pleasant=False).values_list('period', flat=True)),
+            {1, 2}
+        )
+
+    def test_schedule(self):
+        """Testing incremental update of the next occurrence"""
+        habit = Habit.objects.get(owner=self.users[0], period=3,
+                                  is_pleasant=False)
+        self.assertEqual(habit.next_due, self.today)
+        # Habit is moved forward by its period after notification
+        Habit.objects.filter(pk=habit.pk).advance()
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_due,
+                         self.today + datetime.timedelta(days=3))
+        # Notified occurrence is kept after habit update
+        habit.period = 2
+        habit.save()
+        self.assertEqual(habit.next_due,
+                         self.today + datetime.timedelta(days=4))
+        # Missed occurrences are skipped
+        Habit.objects.filter(pk=habit.pk).update(
+            next_due=self.today - datetime.timedelta(days=2))
+        Habit.objects.catch_up(self.today)
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_due, self.today)
+        Habit.objects.filter(pk=habit.pk).update(
+            period=3, next_due=self.today - datetime.timedelta(days=4))
+        with self.assertNumQueries(1):
+            Habit.objects.catch_up(self.today)
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_due,
+                         self.today + datetime.timedelta(days=2))
+
+    def test_digests(self):
+        """Testing digest messages of users with Telegram ID"""
+        digests = dict(iter_digests(self.today))
+        # Only users with Telegram ID receive digest
+        self.assertEqual(set(digests), {1, 2, 3})
+        # Pleasant habits are not mentioned in message
+        self.assertIn('ACTION1', digests[1])
+        self.assertNotIn('PLEASANT', digests[1])
+
+    def test_digests_query_count(self):
+        """Testing that number of queries does not depend on users count"""
+        # Users are streamed by a single cursor and habits are fetched by
+        # one query per chunk
+        with self.assertNumQueries(3):
+            list(iter_digests(self.today, chunk_size=2))
+
+    def test_send_notifications(self):
+        """Testing concurrent delivery of digests to stub Telegram server"""
+        with TelegramStubServer() as stub, self.settings(
+                TELEGRAM_URL=stub.url, NOTIFICATION_SHARD_SIZE=2):
+            send_notifications()
+        # Each user with Telegram ID receives a single message
+        self.assertEqual(
+            sorted(int(message['chat_id']) for message in stub.messages),
+            [1, 2, 3]
+        )
+        # Notified habits are moved to their next occurrence
+        self.assertFalse(
+            Habit.objects.due_on(self.today).filter(
+                owner__in=self.users).exists()
+        )
+
+    def test_notifications_chunk_is_idempotent(self):
+        """Testing that restarted chunk task does not resend digests"""
+        start, end = self.users[0].pk, self.users[-1].pk + 1
+        today = self.today.isoformat()
+        with TelegramStubServer() as stub, self.settings(
+                TELEGRAM_URL=stub.url):
+            send_notifications_chunk(start, end, today)
+            send_notifications_chunk(start, end, today)
+        self.assertEqual(len(stub.messages), 3)
+        # Delivered digests are recorded for users
+        self.assertEqual(
+            User.objects.filter(notified_on=self.today).count(),
+            3
+        )
+
+    def test_notifications_chunk_retry(self):
+        """Testing that undelivered digests are sent by retry of chunk"""
+        start, end = self.users[0].pk, self.users[-1].pk + 1
+        with TelegramStubServer(rate_limited=2) as stub, self.settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_MAX_RETRIES=0):
+            send_notifications_chunk.delay(start, end,
+                                           self.today.isoformat())
+        self.assertEqual(len(stub.messages), 3)
+        self.assertEqual(
+            User.objects.filter(notified_on=self.today).count(),
+            3
+        )
+
+    def test_retry_after_rate_limit(self):
+        """Testing that message is resent after `429` response"""
+        with TelegramStubServer(rate_limited=2) as stub, self.settings(
+                TELEGRAM_URL=stub.url):
+            delivered = TelegramSender(workers=2).deliver(
+                [(1, 'first'), (2, 'second')]
+            )
+        self.assertEqual(sorted(delivered), [1, 2])
+        self.assertEqual(len(stub.messages), 2)
+
+    def test_rate_limit_without_json(self):
+        """
+        Testing that `429` response without JSON body pauses all workers
+        and message is resent
+        """
+        with TelegramStubServer(rate_limited=1, retry_after=None) as stub, \
+                self.settings(TELEGRAM_URL=stub.url):
+            sender = TelegramSender(workers=2)
+            start = time.monotonic()
+            delivered = sender.deliver([(1, 'first'), (2, 'second')])
+        self.assertEqual(sorted(delivered), [1, 2])
+        # Message of the other worker waits for the pause too
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        for sender_class in (TelegramSender, AsyncTelegramSender):
+            with TelegramStubServer(rate_limited=1, retry_after=None) \
+                    as stub, self.settings(TELEGRAM_URL=stub.url):
+                delivered = sender_class().deliver([(1, 'first')])
+            self.assertEqual(delivered, [1])
+
+    def test_send_errors(self):
+        """
+        Testing that message is not resent after it could be received and
+        errors of some messages do not fail others
+        """
+        for sender_class in (TelegramSender, AsyncTelegramSender):
+            with TelegramStubServer(delay=0.3) as stub, self.settings(
+                    TELEGRAM_URL=stub.url, TELEGRAM_TIMEOUT=0.1):
+                delivered = sender_class().deliver([(1, 'first')])
+            self.assertEqual(delivered, [])
+            self.assertEqual(len(stub.requests), 1)
+        # Connection errors are retried
+        with self.settings(TELEGRAM_URL='http://127.0.0.1:1/bot',
+                           TELEGRAM_MAX_RETRIES=2):
+            sender = TelegramSender(workers=2)
+            calls = []
+            post = sender.session.post
+            sender.session.post = lambda *args, **kwargs: \
+                calls.append(args) or post(*args, **kwargs)
+            self.assertEqual(sender.deliver([(1, 'first')]), [])
+        self.assertEqual(len(calls), 3)
+        # Unexpected error of one message does not lose the others
+        with TelegramStubServer() as stub, self.settings(
+                TELEGRAM_URL=stub.url):
+            sender = TelegramSender(workers=2)
+            send = sender.send
+
+            def fail(chat_id, text):
+                if chat_id == 1:
+                    raise RuntimeError
+                return send(chat_id, text)
+
+            sender.send = fail
+            delivered = sender.deliver([(1, 'first'), (2, 'second')])
+        self.assertEqual(delivered, [2])
+
+    def test_chat_buckets(self):
+        """Testing that buckets of idle chats are dropped"""
+        sender = TelegramSender(chat_rate=100)
+        for chat_id in range(5):
+            sender.get_chat_bucket(chat_id).acquire()
+        time.sleep(0.02)
+        sender.get_chat_bucket(5).acquire()
+        self.assertEqual(list(sender.chat_buckets), [5])
+
+    def test_async_sender(self):
+        """Testing delivery by async sender with retries"""
+        with TelegramStubServer(rate_limited=2) as stub, self.settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_SENDER='async'):
+            sender = get_sender()
+            delivered = sender.deliver(iter([(1, 'first'), (2, 'second')]))
+        self.assertIsInstance(sender, AsyncTelegramSender)
+        self.assertEqual(sorted(delivered), [1, 2])
+        self.assertEqual(len(stub.messages), 2)
+
+    def test_token_bucket(self):
+        """Testing that token bucket limits rate of operations"""
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # First token is available at once, others are added every 10ms
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_shared_token_bucket(self):
+        """Testing that buckets of processes share the rate limit"""
+        django_cache.clear()
+        first = SharedTokenBucket('test:rate', rate=100)
+        second = SharedTokenBucket('test:rate', rate=100)
+        # Tokens of window taken by one bucket are not given by the other
+        while not first.take():
+            pass
+        self.assertGreater(second.take(), 0)
+        # Pause of one bucket stops the other
+        first.pause(1)
+        self.assertGreater(second.take(), 0.5)
+
+    def test_reminder_slot(self):
+        """Testing conversion of habit time to UTC minute of the day"""
+        # Moscow time is UTC+3
+        habit = Habit.objects.filter(owner=self.users[0]).first()
+        self.assertEqual(habit.reminder_slot, 4 * 60)
+        # Slots are recomputed when user changes time zone
+        self.users[0].timezone = 'UTC'
+        self.users[0].save()
+        habit.refresh_from_db()
+        self.assertEqual(habit.reminder_slot, 7 * 60)
+        # Habits are not scanned when time zone is not changed
+        user = User.objects.get(pk=self.users[0].pk)
+        user.first_name = 'name'
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_reminders(self):
+        """Testing reminders for habits of the upcoming time slot"""
+        start = datetime.datetime.combine(
+            self.today, datetime.time(4, 0), tzinfo=datetime.timezone.utc)
+        reminders = {telegram_id: message for telegram_id, message, _
+                     in iter_reminders(start, 5)}
+        # Users receive reminder only about due habits of this slot
+        self.assertEqual(set(reminders), {1, 2, 3})
+        self.assertIn('ACTION1', reminders[1])
+        self.assertNotIn('PLEASANT', reminders[1])
+        # No habits in the next time slot
+        self.assertFalse(list(iter_reminders(
+            start + datetime.timedelta(minutes=5), 5)))
+
+
+class QueryPlanTest(APITestCase):
+    """
+    Class for auditing queries of views and tasks and their use of indexes
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Create enough habits of many users for planner to choose indexes
+        as it does on real data
+        """
+        today = datetime.date.today()
+        users = User.objects.bulk_create([
+            User(email=f'user{i}@gmail.com', telegram_id=i)
+            for i in range(50)
+        ])
+        Habit.objects.bulk_create([
+            Habit(place='home', action='action',
+                  time=datetime.time(i % 24, i % 60),
+                  is_pleasant=i % 5 == 0, is_public=i % 10 == 0,
+                  exec_time=60, period=1 + i % 7, owner=users[i % 50],
+                  next_due=today + datetime.timedelta(days=i % 7),
+                  reminder_slot=i % 1440)
+            for i in range(5000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE habit_tracker_habit')
+        cls.user = users[0]
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        django_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def explain(self, sql):
+        """Get query plan of query when sequential scans are disabled"""
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertQueries(self, queries, expected):
+        """
+        Check that captured queries use expected indexes. Queries which do
+        not read habits are ignored
+        """
+        queries = [query['sql'] for query in queries.captured_queries
+                   if 'FROM "habit_tracker_habit"' in query['sql']]
+        self.assertEqual(len(queries), len(expected), queries)
+        for sql, index in zip(queries, expected):
+            self.assertIn(index, self.explain(sql), sql)
+
+    def test_default_ordering(self):
+        """Testing that queries are not ordered unless it is requested"""
+        self.assertNotIn('ORDER BY', str(Habit.objects.all().query))
+
+    def test_habit_list(self):
+        """Testing queries of habit list"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/habits/')
+        # Page is counted and fetched by index of owner and time
+        self.assertQueries(queries, ['habit_owner_time_idx'] * 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/habits/?pagination=cursor')
+        # Keyset pagination does not count habits
+        self.assertQueries(queries, ['habit_owner_time_idx'])
+
+    def test_public_list(self):
+        """Testing queries of public feed"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/habits/public/?pagination=cursor')
+        self.assertQueries(queries, ['habit_public_feed_idx'])
+
+    def test_digests(self):
+        """Testing queries of daily digest"""
+        with CaptureQueriesContext(connection) as queries:
+            list(iter_digests(datetime.date.today(), chunk_size=10))
+        self.assertQueries(queries, ['habit_next_due_owner_idx'] * 5)
+
+    def test_reminders(self):
+        """Testing queries of reminders"""
+        start = datetime.datetime.now(tz=datetime.timezone.utc)
+        with CaptureQueriesContext(connection) as queries:
+            list(iter_reminders(start, 5))
+        self.assertQueries(queries, ['habit_reminder_slot_idx'])
+
+
+class HabitBulkTest(APITestCase):
+    """
+    Class for testing bulk actions with habits
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        self.user = User.objects.create(email='test@gmail.com')
+        self.pleasant = Habit.objects.create(
+            place='home', action='rest', time='08:00', is_pleasant=True,
+            is_public=False, exec_time=60, owner=self.user,
+        )
+        self.client.force_authenticate(self.user)
+
+    def habit_data(self, number, **kwargs):
+        """Compose data of a new habit"""
+        return {
+            'place': 'home', 'action': f'action{number}', 'time': '07:00',
+            'is_pleasant': False, 'is_public': True, 'exec_time': 60,
+            'period': 1, **kwargs
+        }
+
+    def test_bulk_create(self):
+        """Testing creation of a list of habits"""
+        data = [self.habit_data(i, associated_habit=self.pleasant.pk)
+                for i in range(10)]
+        # Habits are validated and inserted by constant number of queries
+        with self.assertNumQueries(4):
+            response = self.client.post('/habits/bulk/', data=data,
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            Habit.objects.filter(owner=self.user,
+                                 associated_habit=self.pleasant).count(),
+            10
+        )
+        # Schedule of habits is computed before insert
+        self.assertFalse(Habit.objects.filter(next_due__isnull=True).exists())
+
+    def test_bulk_create_errors(self):
+        """Testing that invalid list of habits is not saved"""
+        data = [self.habit_data(1), self.habit_data(2, period=10)]
+        response = self.client.post('/habits/bulk/', data=data,
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[1], {
+            'period': ['The period must be less or equal than 7 days']
+        })
+        self.assertEqual(Habit.objects.count(), 1)
+
+    def test_bulk_update_and_delete(self):
+        """Testing update and deletion of a list of habits"""
+        self.client.post('/habits/bulk/', format='json',
+                         data=[self.habit_data(i) for i in range(3)])
+        ids = list(Habit.objects.filter(is_pleasant=False).values_list(
+            'pk', flat=True))
+        response = self.client.patch(
+            '/habits/bulk/', format='json',
+            data=[{'id': pk, 'action': 'new action'} for pk in ids]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Habit.objects.filter(action='new action').count(), 3)
+        # Habits are identified by their IDs only
+        for data in ([{'id': ids[0]}], [[ids[0]]], [str(ids[0])], [True]):
+            response = self.client.delete('/habits/bulk/', data=data,
+                                          format='json')
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        # Habits of other users cannot be changed
+        other = User.objects.create(email='other@gmail.com')
+        Habit.objects.filter(pk=ids[0]).update(owner=other)
+        response = self.client.delete('/habits/bulk/', data=ids,
+                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete('/habits/bulk/', data=ids[1:],
+                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Habit.objects.count(), 2)
+
+
+class HabitExportTest(APITestCase):
+    """
+    Class for testing export of habits
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        self.user = User.objects.create(email='test@gmail.com')
+        other = User.objects.create(email='other@gmail.com')
+        for hour in range(7, 10):
+            Habit.objects.create(
+                place='home', action=f'action{hour}',
+                time=datetime.time(hour), is_pleasant=False, is_public=False,
+                exec_time=60, owner=self.user,
+            )
+        Habit.objects.create(
+            place='work', action='other', time='12:00', is_pleasant=False,
+            is_public=True, exec_time=60, owner=other,
+        )
+        self.client.force_authenticate(self.user)
+
+    def export(self, export_type):
+        """Request export and join streamed content"""
+        response = self.client.get('/habits/export/', {'type': export_type})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Testing export of habits as NDJSON"""
+        lines = self.export('ndjson').splitlines()
+        habits = [json.loads(line) for line in lines]
+        # Only habits of user are exported with the same representation
+        self.assertEqual(
+            habits,
+            HabitSerializer(Habit.objects.filter(owner=self.user)
+                            .order_by('pk'), many=True).data
+        )
+
+    def test_export_json(self):
+        """Testing export of habits as JSON array"""
+        habits = json.loads(self.export('json'))
+        self.assertEqual([habit['action'] for habit in habits],
+                         ['action7', 'action8', 'action9'])
+        # Empty export is a valid JSON array
+        Habit.objects.filter(owner=self.user).delete()
+        self.assertEqual(json.loads(self.export('json')), [])
+
+    def test_export_csv(self):
+        """Testing export of habits as CSV"""
+        rows = list(csv.DictReader(StringIO(self.export('csv'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['time'], '07:00:00')
+        self.assertEqual(rows[0]['award'], '')
+
+    def test_export_errors(self):
+        """Testing export with unknown type or without authentication"""
+        response = self.client.get('/habits/export/', {'type': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(None)
+        response = self.client.get('/habits/export/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_command(self):
+        """Testing export of habits of all users by command"""
+        out = StringIO()
+        call_command('export_habits', '--chunk-size', '2', stdout=out)
+        habits = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(habits), 4)
+        # Habits of selected users are exported
+        out = StringIO()
+        call_command('export_habits', '--type', 'json',
+                     '--user', 'other@gmail.com', stdout=out)
+        self.assertEqual([habit['action']
+                          for habit in json.loads(out.getvalue())],
+                         ['other'])
+
+
+class HabitImportTest(APITestCase):
+    """
+    Class for testing import of habits
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        self.user = User.objects.create(email='test@gmail.com')
+        self.pleasant = Habit.objects.create(
+            place='home', action='rest', time='08:00', is_pleasant=True,
+            is_public=False, exec_time=60, owner=self.user,
+        )
+        self.client.force_authenticate(self.user)
+
+    def habit_data(self, number, **kwargs):
+        """Compose data of a new habit"""
+        return {
+            'place': 'home', 'action': f'action{number}', 'time': '07:00',
+            'is_pleasant': False, 'is_public': False, 'exec_time': 60,
+            'period': 1, **kwargs
+        }
+
+    def upload(self, name, content, **params):
+        """Upload file of habits"""
+        return self.client.post(
+            '/habits/import/?' + '&'.join(f'{key}={value}'
+                                          for key, value in params.items()),
+            {'file': SimpleUploadedFile(
+                name, content if isinstance(content, bytes)
+                else content.encode())},
+            format='multipart',
+        )
+
+    def test_import_ndjson(self):
+        """Testing import of valid and invalid rows of NDJSON"""
+        lines = [
+            json.dumps(self.habit_data(1)),
+            json.dumps(self.habit_data(2, period=8)),
+            '',
+            '{broken',
+            json.dumps(self.habit_data(3, associated_habit=self.pleasant.pk)),
+            json.dumps(self.habit_data(4, award='cake',
+                                       associated_habit=self.pleasant.pk)),
+        ]
+        # Habits are validated and inserted by constant number of queries
+        with self.assertNumQueries(4):
+            response = self.upload('habits.ndjson', '\n'.join(lines))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['failed'], 3)
+        # Errors are reported with line numbers
+        errors = response.json()['errors']
+        self.assertEqual([error['row'] for error in errors], [2, 4, 6])
+        self.assertEqual(errors[0]['errors']['period'],
+                         ['The period must be less or equal than 7 days'])
+        self.assertEqual(
+            errors[2]['errors']['non_field_errors'],
+            ['Habit cannot have both associated habit and award']
+        )
+        habits = Habit.objects.filter(owner=self.user, is_pleasant=False)
+        self.assertEqual(
+            sorted(habits.values_list('action', flat=True)),
+            ['action1', 'action3']
+        )
+        # Schedule of imported habits is computed
+        self.assertFalse(habits.filter(next_due__isnull=True).exists())
+
+    def test_import_json(self):
+        """Testing import of JSON array by batches"""
+        data = [self.habit_data(i) for i in range(5)] + [1]
+        with self.settings(HABIT_IMPORT_BATCH_SIZE=2):
+            response = self.upload('habits.txt', json.dumps(data),
+                                   type='json')
+        self.assertEqual(response.json()['created'], 5)
+        self.assertEqual(response.json()['errors'], [{
+            'row': 6,
+            'errors': {'non_field_errors': ['Expected a habit object']},
+        }])
+
+    def test_import_csv(self):
+        """Testing import of exported CSV"""
+        Habit.objects.create(owner=self.user, **self.habit_data(1))
+        content = b''.join(
+            self.client.get('/habits/export/', {'type': 'csv'})
+            .streaming_content
+        ).decode()
+        response = self.upload('habits.csv', content)
+        self.assertEqual(response.json(),
+                         {'created': 2, 'failed': 0, 'errors': []})
+        self.assertEqual(
+            Habit.objects.filter(owner=self.user, action='action1').count(),
+            2
+        )
+
+    def test_import_encoding(self):
+        """Testing that habits saved before undecodable part are reported"""
+        # File is decoded by chunks, so habits of the first chunks are saved
+        content = '\n'.join(json.dumps(self.habit_data(i))
+                            for i in range(200)).encode()
+        with self.settings(HABIT_IMPORT_BATCH_SIZE=10):
+            response = self.upload('habits.ndjson', content + b'\n\xff')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = response.json()['created']
+        self.assertGreater(created, 0)
+        self.assertEqual(response.json()['errors'], [{
+            'row': created + 1,
+            'errors': {'non_field_errors': ['File must be encoded in UTF-8']},
+        }])
+        self.assertEqual(
+            Habit.objects.filter(owner=self.user, is_pleasant=False).count(),
+            created
+        )
+
+    def test_import_errors(self):
+        """Testing import of file of unknown type"""
+        response = self.upload('habits.xml', '<habits/>')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/habits/import/', {},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_command(self):
+        """Testing import of habits by command"""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(json.dumps(self.habit_data(1)) + '\n'
+                       + json.dumps(self.habit_data(2, exec_time=0)))
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_habits', file.name, '--user',
+                         'test@gmail.com', stdout=out, stderr=err)
+        self.assertIn('Created 1 habits, 1 rows failed', out.getvalue())
+        self.assertIn('Row 2', err.getvalue())
+
+
+class BenchmarkTest(APITestCase):
+    """
+    Class for testing benchmark of API and tasks
+    """
+
+    def test_run_benchmark(self):
+        """Testing that all scenarios are measured on seeded data"""
+        results = run_benchmark(users=3, habits=8, requests=2,
+                                concurrency=2, latency=0)
+        self.assertEqual(Habit.objects.count(), 24)
+        self.assertEqual(set(results['endpoints']), {
+            'habits_list_cold', 'habits_list_warm', 'habits_public_cold',
+            'habits_public_warm', 'habits_complete', 'users_register',
+            'users_token',
+        })
+        # Cached list is returned without reading habits
+        self.assertLess(results['endpoints']['habits_list_warm']['queries'],
+                        results['endpoints']['habits_list_cold']['queries'])
+        self.assertEqual(results['tasks']['send_notifications']['messages'],
+                         3)
+        self.assertEqual(
+            User.objects.filter(telegram_id__isnull=False).count(), 3)
+        self.assertEqual(set(results['concurrency']), {
+            'wsgi_habit_detail', 'asgi_habit_detail', 'telegram_threads',
+            'telegram_async',
+        })
+        self.assertEqual(set(results['passwords']), {
+            'hash_password_threads', 'check_password_threads',
+            'hash_password_processes', 'check_password_processes',
+        })
+        self.assertEqual(results['throttling']['sliding_window']['requests'],
+                         2)
+
+    def test_measure_throughput(self):
+        """Testing that throughput counts wall time of all requests"""
+        def request(number):
+            time.sleep(0.01)
+            return HttpResponse()
+
+        result = measure(request, 5, prepare=lambda: time.sleep(0.01))
+        self.assertGreaterEqual(result['mean_ms'], 10)
+        # Each request takes 20ms together with preparation
+        self.assertLessEqual(result['throughput_rps'], 50)
+        self.assertGreater(result['throughput_rps'], 10)
+
+    def test_compare(self):
+        """Testing comparison of results of two runs"""
+        baseline = {'endpoints': {'habits_list_cold': {
+            'p50_ms': 10, 'throughput_rps': 100, 'queries': 3}}}
+        results = {'endpoints': {'habits_list_cold': {
+            'p50_ms': 5, 'throughput_rps': 200, 'queries': 3}},
+            'tasks': {'send_notifications': {'seconds': 1}}}
+        self.assertEqual(list(compare(baseline, results)), [
+            ('habits_list_cold', 'p50_ms', 10, 5, 0.5),
+            ('habits_list_cold', 'throughput_rps', 100, 200, 1.0),
+            ('habits_list_cold', 'queries', 3, 3, 0.0),
+        ])
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(APITestCase):
+    """
+    Class for testing metrics of requests and tasks
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        django_cache.clear()
+        metrics._registry.clear()
+        metrics._flushed.update(time=0, slot=None)
+        self.user = User.objects.create(email='test@gmail.com',
+                                        telegram_id=1)
+        Habit.objects.create(
+            place='home', action='run', time='07:00', is_pleasant=False,
+            is_public=True, exec_time=60, owner=self.user,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics(self):
+        """Testing metrics of requests"""
+        response = self.client.get('/habits/')
+        # Time of each part of request is sent to client
+        self.assertRegex(response['Server-Timing'],
+                         r'db;dur=[\d.]+;desc="\d+ queries", '
+                         r'external;dur=[\d.]+, app;dur=[\d.]+, '
+                         r'total;dur=[\d.]+')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn('# TYPE habit_tracker_http_request_duration_seconds '
+                      'histogram', content)
+        self.assertIn('habit_tracker_http_request_db_queries_count'
+                      '{method="GET",view="courses:habits-list"} 1',
+                      content)
+        self.assertIn('habit_tracker_http_request_db_queries_bucket'
+                      '{method="GET",view="courses:habits-list",le="+Inf"} 1',
+                      content)
+
+    def test_cache_metrics(self):
+        """Testing counters of hits and misses of cached habit lists"""
+        self.client.get('/habits/')
+        self.client.get('/habits/')
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE habit_tracker_list_cache_requests_total '
+                      'counter', content)
+        for result in ('hit', 'miss'):
+            self.assertIn(f'habit_tracker_list_cache_requests_total'
+                          f'{{result="{result}",'
+                          f'view="courses:habits-list"}} 1', content)
+
+    def test_task_metrics(self):
+        """Testing metrics of tasks published by worker processes"""
+        celery_app.conf.task_always_eager = True
+        try:
+            with TelegramStubServer() as stub, self.settings(
+                    TELEGRAM_URL=stub.url):
+                send_notifications.delay()
+        finally:
+            celery_app.conf.task_always_eager = False
+        # Metrics of worker are read from cache by web process
+        process = metrics.snapshot()
+        metrics._registry.clear()
+        django_cache.set(metrics.get_slot_key(0),
+                         {'process': metrics.PROCESS_ID, 'histograms': {}})
+        django_cache.set(metrics.get_slot_key(1),
+                         {'process': 'worker:1', 'histograms': process})
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn('habit_tracker_celery_task_duration_seconds_count'
+                      '{task="config.tasks.send_notifications"} 1', content)
+        # Messages to Telegram are measured as external requests
+        self.assertRegex(
+            content,
+            r'habit_tracker_celery_task_external_seconds_sum'
+            r'\{task="config.tasks.send_notifications_chunk"\} 0\.\d*[1-9]'
+        )
+
+    async def test_async_request_metrics(self):
+        """Testing that queries of async views are measured"""
+        token = f'Bearer {AccessToken.for_user(self.user)}'
+        response = await self.async_client.get('/async/habits/',
+                                               AUTHORIZATION=token)
+        self.assertRegex(response['Server-Timing'],
+                         r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    def test_process_slots(self):
+        """Testing that processes publish metrics by their own slots"""
+        django_cache.set(metrics.get_slot_key(0),
+                         {'process': 'worker:1', 'histograms': {}})
+        metrics.flush(force=True)
+        self.assertEqual(metrics._flushed['slot'], 1)
+        self.assertEqual(
+            django_cache.get(metrics.get_slot_key(0))['process'], 'worker:1')
+        # Slot of this process is reused by next publication
+        metrics.flush(force=True)
+        self.assertEqual(metrics._flushed['slot'], 1)
+        # Slot taken by another process after expiration is not overwritten
+        django_cache.set(metrics.get_slot_key(1),
+                         {'process': 'worker:2', 'histograms': {}})
+        metrics.flush(force=True)
+        self.assertEqual(metrics._flushed['slot'], 2)
+        self.assertEqual(
+            django_cache.get(metrics.get_slot_key(1))['process'], 'worker:2')
+
+    def test_metrics_token(self):
+        """Testing that metrics are only available to scraper with token"""
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        """Testing that nothing is measured when metrics are disabled"""
+        response = self.client.get('/habits/')
+        self.assertNotIn('Server-Timing', response)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(metrics.snapshot(), {})
+
+
+class AsyncHabitTest(APITestCase):
+    """
+    Class for testing async versions of habit endpoints
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        django_cache.clear()
+        self.user = User.objects.create(email='test@gmail.com')
+        self.other = User.objects.create(email='other@gmail.com')
+        self.pleasant = Habit.objects.create(
+            place='home', action='rest', time='08:00', is_pleasant=True,
+            is_public=True, exec_time=60, owner=self.user,
+        )
+        for hour in range(6, 13):
+            Habit.objects.create(
+                place='home', action=f'action{hour}',
+                time=datetime.time(hour), is_pleasant=False,
+                is_public=hour % 2 == 0, exec_time=60, owner=self.user,
+                associated_habit=self.pleasant,
+            )
+        self.private = Habit.objects.create(
+            place='work', action='other', time='12:00', is_pleasant=False,
+            is_public=False, exec_time=60, owner=self.other,
+        )
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+
+    async def test_habit_list(self):
+        """Testing that async list is the same as sync one"""
+        for params in ({}, {'page': 2}, {'pagination': 'cursor'},
+                       {'expand': 'associated_habit'}):
+            response = await self.async_client.get(
+                '/async/habits/', params, AUTHORIZATION=self.token)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            await sync_to_async(django_cache.clear)()
+            expected = await sync_to_async(self.client.get)(
+                '/habits/', params, HTTP_AUTHORIZATION=self.token)
+            self.assertEqual(response.content.decode().replace('/async', ''),
+                             expected.content.decode())
+        # Next page of keyset pagination is followed
+        response = await self.async_client.get(
+            '/async/habits/',
+            {'pagination': 'cursor'}, AUTHORIZATION=self.token)
+        response = await self.async_client.get(
+            response.json()['next'], AUTHORIZATION=self.token)
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertIsNone(response.json()['next'])
+
+    async def test_habit_list_errors(self):
+        """Testing authentication and invalid pages of async list"""
+        response = await self.async_client.get('/async/habits/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(
+            '/async/habits/', AUTHORIZATION='Bearer invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(
+            '/async/habits/', {'page': 10}, AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post(
+            '/async/habits/', AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_habit_detail(self):
+        """Testing async retrieval of habit"""
+        response = await self.async_client.get(
+            f'/async/habits/{self.pleasant.pk}/', AUTHORIZATION=self.token)
+        self.assertEqual(response.json()['action'], 'rest')
+        # Only owner can view habit
+        response = await self.async_client.get(
+            f'/async/habits/{self.private.pk}/', AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.async_client.get(
+            '/async/habits/0/', AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_public_list(self):
+        """Testing async public feed with conditional responses"""
+        response = await self.async_client.get('/async/habits/public/')
+        self.assertEqual(response.json()['count'], 5)
+        expected = await sync_to_async(self.client.get)('/habits/public/')
+        self.assertEqual(response.json()['results'],
+                         expected.json()['results'])
+        # Client receives `304 Not Modified` for unchanged feed
+        response = await self.async_client.get(
+            '/async/habits/public/', IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+def throttle_rates(**rates):
+    """Override rates of throttles of DRF"""
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+class BrokenCache:
+    """Cache which is not available"""
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            raise ConnectionError('Cache is not available')
+        return method
+
+
+class ThrottlingTest(APITestCase):
+    """
+    Class for testing rate limits and admission control of requests
+    """
+
+    def setUp(self):
+        """Clear counters of requests before each test"""
+        django_cache.clear()
+        self.user = User.objects.create(email='test@gmail.com')
+        self.request = Request(RequestFactory().get('/habits/'))
+        self.request.user = self.user
+
+    def allow(self, now, cache=None):
+        """Check request by throttle at given time"""
+        throttle = UserRateThrottle()
+        throttle.timer = lambda: now
+        if cache is not None:
+            throttle.cache = cache
+        return throttle.allow_request(self.request, None), throttle
+
+    @throttle_rates(user='10/min')
+    def test_sliding_window(self):
+        """Testing that requests of previous window are partly counted"""
+        start = 60 * 1000
+        for _ in range(10):
+            self.assertTrue(self.allow(start + 30)[0])
+        allowed, throttle = self.allow(start + 30)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 30 + 6)
+        # Half of previous window is still in sliding window
+        for _ in range(5):
+            self.assertTrue(self.allow(start + 90)[0])
+        allowed, throttle = self.allow(start + 90)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 6)
+        self.assertTrue(self.allow(start + 96)[0])
+
+    @throttle_rates(user='2/min')
+    def test_local_fallback(self):
+        """Testing that requests are counted by process without cache"""
+        self.assertTrue(self.allow(10, BrokenCache())[0])
+        self.assertTrue(self.allow(10, BrokenCache())[0])
+        self.assertFalse(self.allow(10, BrokenCache())[0])
+
+    @throttle_rates(anon='2/min', register='1/hour')
+    def test_public_endpoints(self):
+        """Testing that anonymous clients are limited by IP address"""
+        for _ in range(2):
+            response = self.client.get('/habits/public/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get('/habits/public/')
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        # Registration has its own scope
+        django_cache.clear()
+        response = self.client.post('/users/register/', data={
+            'email': 'new@gmail.com', 'password': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/users/register/', data={
+            'email': 'next@gmail.com', 'password': 'test'})
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(anon='1/min')
+    def test_forwarded_address(self):
+        """
+        Testing that clients cannot avoid limits by forged addresses and
+        addresses set by proxies are used
+        """
+        self.client.get('/habits/public/', HTTP_X_FORWARDED_FOR='1.1.1.1')
+        response = self.client.get('/habits/public/',
+                                   HTTP_X_FORWARDED_FOR='2.2.2.2')
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        with override_settings(REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            response = self.client.get('/habits/public/',
+                                       HTTP_X_FORWARDED_FOR='3.3.3.3')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @throttle_rates(anon='1/min', user='1/min')
+    async def test_async_endpoints(self):
+        """Testing that async endpoints are limited like DRF views"""
+        token = f'Bearer {AccessToken.for_user(self.user)}'
+        for url, headers in (('/async/habits/public/', {}),
+                             ('/async/habits/', {'AUTHORIZATION': token})):
+            response = await self.async_client.get(url, **headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = await self.async_client.get(url, **headers)
+            self.assertEqual(response.status_code,
+                             status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+
+    @override_settings(MAX_CONCURRENT_REQUESTS=1, ADMISSION_TIMEOUT=0)
+    def test_concurrency_limit(self):
+        """Testing that requests above limit are rejected"""
+        nested = []
+
+        def get_response(request):
+            # Request arrives while the only slot is taken
+            nested.append(middleware(request))
+            return HttpResponse()
+
+        middleware = ConcurrencyLimitMiddleware(get_response)
+        request = RequestFactory().get('/habits/')
+        self.assertEqual(middleware(request).status_code, status.HTTP_200_OK)
+        self.assertEqual(nested[0].status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        # Slot is released after response
+        self.assertEqual(middleware(request).status_code, status.HTTP_200_OK)
+
+
+class HabitCompletionTest(APITestCase):
+    """
+    Class for testing completion log and statistics of habits
+    """
+
+    def setUp(self):
+        """Set up habits created 10 days ago"""
+        self.user = User.objects.create(email='test@gmail.com')
+        self.other = User.objects.create(email='other@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.today = datetime.date.today()
+        self.daily = Habit.objects.create(
+            place='home', action='run', time='08:00', is_pleasant=False,
+            is_public=False, exec_time=60, period=1, owner=self.user,
+        )
+        self.weekly = Habit.objects.create(
+            place='home', action='read', time='09:00', is_pleasant=False,
+            is_public=False, exec_time=60, period=7, owner=self.user,
+        )
+        self.private = Habit.objects.create(
+            place='work', action='other', time='12:00', is_pleasant=False,
+            is_public=False, exec_time=60, owner=self.other,
+        )
+        Habit.objects.update(
+            created_on=self.today - datetime.timedelta(days=10))
+
+    def day(self, days_ago):
+        return (self.today - datetime.timedelta(days=days_ago)).isoformat()
+
+    def complete(self, *items):
+        return self.client.post('/habits/complete/', list(items),
+                                format='json')
+
+    def test_complete(self):
+        """Testing that statistics are updated by appended completions"""
+        response = self.complete(
+            *({'habit': self.daily.pk, 'date': self.day(days)}
+              for days in (3, 2, 1)),
+            {'habit': self.weekly.pk, 'status': 'skipped'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [
+            {'habit': self.daily.pk, 'done_count': 3, 'current_streak': 3,
+             'longest_streak': 3, 'last_done_on': self.day(1),
+             'completion_rate': round(3 / 11, 4)},
+            {'habit': self.weekly.pk, 'done_count': 0, 'current_streak': 0,
+             'longest_streak': 0, 'last_done_on': None,
+             'completion_rate': 0},
+        ])
+        # Today is the default date and repeated completion is ignored
+        response = self.complete({'habit': self.daily.pk},
+                                 {'habit': self.daily.pk})
+        self.assertEqual(response.json()[0]['done_count'], 4)
+        self.assertEqual(response.json()[0]['current_streak'], 4)
+        response = self.complete({'habit': self.daily.pk})
+        self.assertEqual(response.json()[0]['done_count'], 4)
+        self.assertEqual(HabitCompletion.objects.count(), 5)
+        # Habit cannot be done before it was created
+        response = self.complete({'habit': self.weekly.pk},
+                                 {'habit': self.daily.pk,
+                                  'date': self.day(11)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[1], {
+            'date': ['Habit cannot be done before it was created']})
+        self.assertEqual(HabitCompletion.objects.count(), 5)
+
+    def test_streaks(self):
+        """Testing streaks of habits with gaps and late completions"""
+        self.complete(*({'habit': self.daily.pk, 'date': self.day(days)}
+                        for days in (9, 8, 7, 5, 4)))
+        stats = HabitStats.objects.get(pk=self.daily.pk)
+        self.assertEqual((stats.current_streak, stats.longest_streak),
+                         (2, 3))
+        # Streak is broken unless habit was done within its period
+        response = self.client.get(f'/habits/{self.daily.pk}/completions/')
+        self.assertEqual(response.json()['stats']['current_streak'], 0)
+        # Missed day is filled in and streaks are computed from log
+        response = self.complete({'habit': self.daily.pk,
+                                  'date': self.day(6)})
+        self.assertEqual(response.json()[0]['longest_streak'], 6)
+        self.assertEqual(response.json()[0]['done_count'], 6)
+        # Weekly habit keeps streak when done within a week
+        response = self.complete(
+            {'habit': self.weekly.pk, 'date': self.day(9)},
+            {'habit': self.weekly.pk, 'date': self.day(3)},
+        )
+        self.assertEqual(response.json()[0]['current_streak'], 2)
+
+    def test_queries(self):
+        """Testing that the number of queries does not depend on size"""
+        with CaptureQueriesContext(connection) as small:
+            self.complete({'habit': self.daily.pk, 'date': self.day(9)})
+        with CaptureQueriesContext(connection) as large:
+            self.complete(*({'habit': habit.pk, 'date': self.day(days)}
+                            for habit in (self.daily, self.weekly)
+                            for days in range(9)))
+        self.assertEqual(len(large.captured_queries),
+                         len(small.captured_queries))
+
+    def test_errors(self):
+        """Testing validation of completions"""
+        response = self.complete({'habit': self.private.pk})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.complete({'habit': self.daily.pk,
+                                  'date': self.day(-2)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.complete({'habit': self.daily.pk,
+                                  'status': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/habits/complete/',
+                                    {'habit': self.daily.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(HabitCompletion.objects.exists())
+
+    def test_lock_order(self):
+        """Testing that statistics of habits are locked in order of IDs"""
+        with CaptureQueriesContext(connection) as queries:
+            self.complete({'habit': self.weekly.pk, 'date': self.day(0)},
+                          {'habit': self.daily.pk, 'date': self.day(0)})
+        locks = [query['sql'] for query in queries.captured_queries
+                 if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locks), 1)
+        self.assertIn('ORDER BY', locks[0])
+
+    def test_completions(self):
+        """Testing log of habit between dates"""
+        Habit.objects.filter(pk=self.daily.pk).update(
+            created_on=self.today - datetime.timedelta(days=60))
+        self.complete({'habit': self.daily.pk, 'date': self.day(40)},
+                      {'habit': self.daily.pk, 'date': self.day(2)},
+                      {'habit': self.daily.pk, 'status': 'skipped'})
+        response = self.client.get(f'/habits/{self.daily.pk}/completions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['log'], [
+            {'date': self.day(2), 'status': 'done'},
+            {'date': self.day(0), 'status': 'skipped'},
+        ])
+        self.assertEqual(response.json()['stats']['done_count'], 2)
+        response = self.client.get(
+            f'/habits/{self.daily.pk}/completions/',
+            {'start': self.day(50), 'end': self.day(30)})
+        self.assertEqual(response.json()['log'], [
+            {'date': self.day(40), 'status': 'done'}])
+        # Habit without completions has empty statistics
+        response = self.client.get(f'/habits/{self.weekly.pk}/completions/')
+        self.assertEqual(response.json()['stats']['done_count'], 0)
+        response = self.client.get(
+            f'/habits/{self.daily.pk}/completions/',
+            {'start': self.day(400)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f'/habits/{self.private.pk}/completions/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AnalyticsTest(APITestCase):
+    """
+    Class for testing statistics of habits
+    """
+
+    def setUp(self):
+        """Set up habits of two users"""
+        django_cache.clear()
+        self.user = User.objects.create(email='test@gmail.com')
+        self.other = User.objects.create(email='other@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.pleasant = Habit.objects.create(
+            place='home', action='rest', time='08:30', is_pleasant=True,
+            is_public=True, exec_time=60, owner=self.user,
+        )
+        Habit.objects.create(
+            place='home', action='run', time='08:00', is_pleasant=False,
+            is_public=False, exec_time=60, period=2, owner=self.user,
+            associated_habit=self.pleasant,
+        )
+        Habit.objects.create(
+            place='work', action='read', time='23:59', is_pleasant=False,
+            is_public=True, exec_time=60, period=7, award='cake',
+            owner=self.user,
+        )
+        Habit.objects.create(
+            place='work', action='walk', time='00:00', is_pleasant=False,
+            is_public=False, exec_time=60, owner=self.other,
+        )
+
+    def test_user_stats(self):
+        """Testing statistics of user's habits and their cache"""
+        response = self.client.get('/habits/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.json()
+        self.assertEqual(stats['habits'], 3)
+        self.assertEqual(stats['by_period'], {
+            '1': 1, '2': 1, '3': 0, '4': 0, '5': 0, '6': 0, '7': 1})
+        self.assertEqual(stats['by_hour'][8], 2)
+        self.assertEqual(stats['by_hour'][23], 1)
+        self.assertEqual(sum(stats['by_hour']), 3)
+        self.assertEqual((stats['pleasant'], stats['useful']), (1, 2))
+        self.assertEqual(stats['pleasant_ratio'], 0.3333)
+        self.assertEqual((stats['award'], stats['associated_habit'],
+                          stats['public']), (1, 1, 2))
+        with self.assertNumQueries(0):
+            self.client.get('/habits/stats/')
+        # Statistics are counted again after habits changed
+        self.pleasant.delete()
+        stats = self.client.get('/habits/stats/').json()
+        self.assertEqual((stats['habits'], stats['pleasant']), (2, 0))
+
+    @override_settings(HABIT_STATS_SHARD_SIZE=1)
+    def test_global_stats(self):
+        """Testing that only changed shards of users are counted again"""
+        response = self.client.get('/habits/stats/global/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['habits'], 4)
+        self.assertEqual(response.json()['by_hour'][0], 1)
+        Habit.objects.create(
+            place='work', action='swim', time='10:00', is_pleasant=False,
+            is_public=False, exec_time=60, owner=self.other,
+        )
+        # The last user ID and habits of the changed shard are queried
+        with self.assertNumQueries(2):
+            response = self.client.get('/habits/stats/global/')
+        self.assertEqual(response.json()['habits'], 5)
+        self.assertEqual(response.json()['public_share'], 0.4)
+        # Habits without owner are counted too
+        Habit.objects.create(
+            place='work', action='swim', time='10:00', is_pleasant=False,
+            is_public=False, exec_time=60,
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get('/habits/stats/global/')
+        self.assertEqual(response.json()['habits'], 6)
+        # Evicted version does not restore statistics of previous ones
+        django_cache.delete(f'habits:shard:{self.other.pk}:version')
+        Habit.objects.filter(owner=self.other).delete()
+        response = self.client.get('/habits/stats/global/')
+        self.assertEqual(response.json()['habits'], 4)
+
+    def test_habit_report(self):
+        """Testing command of global statistics"""
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as file:
+            call_command('habit_report', '--refresh', '--output', file.name,
+                         stderr=StringIO())
+            report = json.load(file)
+        self.assertEqual(report['habits'], 4)
+        self.assertEqual(report['by_period']['1'], 2)
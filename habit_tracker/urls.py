@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework import routers
 
+from habit_tracker import async_views
 from habit_tracker.apps import HabitTrackerConfig
 from habit_tracker.views import HabitViewSet, HabitPublicListAPIView
 
@@ -13,4 +14,10 @@ router.register('habits', HabitViewSet, basename='habits')
 urlpatterns = [
     path('habits/public/', HabitPublicListAPIView.as_view(),
          name='public-list'),
+    # Native async versions of reading endpoints for ASGI deployment
+    path('async/habits/', async_views.habit_list, name='async-habits-list'),
+    path('async/habits/<int:pk>/', async_views.habit_detail,
+         name='async-habits-detail'),
+    path('async/habits/public/', async_views.habit_public_list,
+         name='async-public-list'),
 ] + router.urls
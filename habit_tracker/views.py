@@ -1,9 +1,40 @@
-from rest_framework import viewsets, generics
+import datetime
+import hashlib
+import io
 
-from habit_tracker.models import Habit
-from habit_tracker.paginators import DefaultPaginator
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets, generics, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from habit_tracker import cache
+from habit_tracker.analytics import get_global_stats, get_user_stats
+from habit_tracker.completions import get_log, mark_habits
+from habit_tracker.export import CONTENT_TYPES, export_habits
+from habit_tracker.imports import PARSERS, import_habits
+from habit_tracker.models import CompletionStatus, Habit, HabitStats
+from habit_tracker.paginators import DefaultPaginator, KeysetPaginator, \
+    is_keyset_requested
 from habit_tracker.permissions import IsOwner
-from habit_tracker.serializers import HabitSerializer
+from habit_tracker.serializers import CompletionRangeSerializer, \
+    HabitCompletionSerializer, HabitSerializer, HabitStatsSerializer, \
+    get_expand, get_related_habits, habit_values_serializer
+
+
+def list_values(view, queryset):
+    """
+    Paginate and serialize habits from `.values()` rows, which is much
+    cheaper than serialization of model instances
+    """
+    page = view.paginate_queryset(
+        habit_values_serializer.get_values(queryset))
+    return view.get_paginated_response(
+        habit_values_serializer.to_representation(page))
 
 
 class HabitViewSet(viewsets.ModelViewSet):
@@ -13,19 +44,241 @@ class HabitViewSet(viewsets.ModelViewSet):
     queryset = Habit.objects.all()
     serializer_class = HabitSerializer
 
+    def get_queryset(self):
+        """Load habits with related data for reading actions"""
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = HabitSerializer.setup_queryset(
+                queryset, get_expand(self.request))
+        elif self.action in ('update', 'partial_update'):
+            # Reminder slot of saved habit depends on owner's time zone
+            queryset = queryset.select_related('owner')
+        return queryset
+
+    def get_serializer_context(self):
+        """
+        Pass related fields to be inlined to serializer. Private associated
+        habits of user are inlined too
+        """
+        context = super().get_serializer_context()
+        context['expand'] = get_expand(self.request)
+        context['viewer'] = self.request.user.pk
+        return context
+
     def perform_create(self, serializer):
         """Save owner field during creation"""
-        new_habit = serializer.save()
-        new_habit.owner = self.request.user
-        new_habit.save()
+        serializer.save(owner=self.request.user)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """
+        Create, update or delete a list of habits of user at once. Habits
+        are validated in one pass and saved by a single query
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError('Expected a list of habits')
+        if len(items) > settings.HABIT_BULK_MAX_SIZE:
+            raise ValidationError(
+                f'No more than {settings.HABIT_BULK_MAX_SIZE} habits '
+                f'can be processed at once')
+        if request.method == 'POST':
+            return self.bulk_create(items)
+        # Habits are identified by `id` field for update or by itself
+        if request.method == 'PATCH':
+            if not all(isinstance(item, dict) for item in items):
+                raise ValidationError('Expected a list of habits')
+            ids = [item.get('id') for item in items]
+        else:
+            # Booleans are ints too but cannot identify habits
+            if not all(isinstance(item, int) and not isinstance(item, bool)
+                       for item in items):
+                raise ValidationError('Expected a list of habit IDs')
+            ids = items
+        # Only habits of user can be changed
+        habits = Habit.objects.filter(owner=request.user, pk__in=[
+            pk for pk in ids if isinstance(pk, int)
+        ]).select_related('owner', 'associated_habit').in_bulk()
+        missing = [pk for pk in ids if pk not in habits]
+        if missing:
+            raise NotFound(f'Habits not found: {missing}')
+        if request.method == 'PATCH':
+            return self.bulk_update(items, habits)
+        # Signals are sent for each deleted habit
+        Habit.objects.filter(pk__in=habits).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream all habits of user as NDJSON, JSON array or CSV chosen by
+        `?type=` parameter
+        """
+        export_format = request.query_params.get('type', 'ndjson')
+        if export_format not in CONTENT_TYPES:
+            raise ValidationError(
+                f'Export type must be one of: {", ".join(CONTENT_TYPES)}')
+        response = StreamingHttpResponse(
+            export_habits(Habit.objects.filter(owner=request.user),
+                          export_format),
+            content_type=CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="habits.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_habits(self, request):
+        """
+        Create habits of user from uploaded NDJSON, JSON array or CSV
+        `file`. Valid habits are saved and errors of other rows reported
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError('File of habits is required')
+        # Type of file is taken from parameter or file extension
+        import_format = request.query_params.get(
+            'type', upload.name.rsplit('.', 1)[-1].lower())
+        if import_format not in PARSERS:
+            raise ValidationError(
+                f'Import type must be one of: {", ".join(PARSERS)}')
+        file = io.TextIOWrapper(upload.file, encoding='utf-8-sig',
+                                newline='')
+        report = import_habits(file, import_format, request.user)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def complete(self, request):
+        """
+        Mark a list of habits of user as done or skipped on dates. Returns
+        statistics of habits updated by the new completions
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError('Expected a list of completions')
+        if len(items) > settings.HABIT_BULK_MAX_SIZE:
+            raise ValidationError(
+                f'No more than {settings.HABIT_BULK_MAX_SIZE} completions '
+                f'can be processed at once')
+        serializer = HabitCompletionSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        ids = {item['habit'] for item in serializer.validated_data}
+        # Only habits of user can be marked
+        habits = Habit.objects.filter(owner=request.user, pk__in=ids).only(
+            'period', 'created_on').in_bulk()
+        missing = sorted(ids - set(habits))
+        if missing:
+            raise NotFound(f'Habits not found: {missing}')
+        # Habit cannot be done before it was created
+        errors = [
+            {'date': ['Habit cannot be done before it was created']}
+            if item['date'] < habits[item['habit']].created_on else {}
+            for item in serializer.validated_data
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+        stats = mark_habits(habits, serializer.validated_data)
+        for pk, habit_stats in stats.items():
+            habit_stats.habit = habits[pk]
+        return Response(HabitStatsSerializer(
+            [stats[pk] for pk in sorted(stats)], many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def completions(self, request, pk=None):
+        """
+        Statistics of habit and its completions between `start` and `end`
+        dates, which are the last 30 days by default
+        """
+        habit = self.get_object()
+        params = CompletionRangeSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        end = params.validated_data.get('end', datetime.date.today())
+        start = params.validated_data.get(
+            'start', end - datetime.timedelta(days=29))
+        if start > end or (end - start).days >= \
+                settings.HABIT_COMPLETION_MAX_DAYS:
+            raise ValidationError(
+                f'Range of dates must be within '
+                f'{settings.HABIT_COMPLETION_MAX_DAYS} days')
+        try:
+            stats = habit.stats
+        except HabitStats.DoesNotExist:
+            stats = HabitStats(habit=habit)
+        return Response({
+            'stats': HabitStatsSerializer(stats).data,
+            'log': [{'date': date.isoformat(),
+                     'status': CompletionStatus(status).label}
+                    for date, status in get_log(habit, start, end)],
+        })
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Statistics of habits of user: periods, hours, pleasant habits,
+        awards and public habits
+        """
+        return Response(get_user_stats(request.user.pk))
+
+    @action(detail=False, methods=['get'], url_path='stats/global')
+    def global_stats(self, request):
+        """Statistics of habits of all users"""
+        return Response(get_global_stats())
+
+    def bulk_create(self, items):
+        """Create a list of habits"""
+        context = self.get_serializer_context()
+        context['related_habits'] = get_related_habits(
+            items, self.request.user)
+        serializer = self.get_serializer(data=items, many=True,
+                                         context=context)
+        serializer.is_valid(raise_exception=True)
+        # Owner is assigned before insert
+        serializer.save(owner=self.request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, items, habits):
+        """Partially update a list of habits identified by `id` field"""
+        context = self.get_serializer_context()
+        context['related_habits'] = get_related_habits(
+            items, self.request.user)
+        serializers = [
+            self.get_serializer(habits[item['id']], data=item, partial=True,
+                                context=context)
+            for item in items
+        ]
+        # Report errors of each habit
+        valid = [serializer.is_valid() for serializer in serializers]
+        if not all(valid):
+            raise ValidationError(
+                [serializer.errors for serializer in serializers])
+        instances = self.get_serializer(many=True).update(
+            [serializer.instance for serializer in serializers],
+            [serializer.validated_data for serializer in serializers],
+        )
+        return Response(self.get_serializer(instances, many=True).data)
 
     def list(self, request, *args, **kwargs):
         """Override LIST action so that only habits of user are displayed"""
         # Check if user is NOT moderator
-        self.queryset = Habit.objects.filter(owner=self.request.user)
+        self.queryset = Habit.objects.filter(
+            owner=self.request.user
+        ).order_by(*KeysetPaginator.ordering)
         # Add pagination
-        self.pagination_class = DefaultPaginator
-        return super().list(request, *args, **kwargs)
+        if is_keyset_requested(request):
+            self.pagination_class = KeysetPaginator
+        else:
+            self.pagination_class = DefaultPaginator
+        # Return cached page of habit list if it exists
+        key = cache.get_list_key(self.request.user.pk, request.query_params)
+        data = cache.get_list(key, request.resolver_match.view_name)
+        if data is not None:
+            return Response(data)
+        if get_expand(request):
+            response = super().list(request, *args, **kwargs)
+        else:
+            response = list_values(self, self.queryset)
+        cache.set_list(key, response.data)
+        return response
 
     def get_permissions(self):
         """
@@ -42,9 +295,13 @@ class HabitViewSet(viewsets.ModelViewSet):
         elif self.action == 'partial_update':
             # Only Owner can partially update this habit
             permission_classes = [IsOwner]
-        elif self.action == 'destroy':
-            # Only Owner can delete this habit
+        elif self.action in ('destroy', 'completions'):
+            # Only Owner can delete this habit or see its completions
             permission_classes = [IsOwner]
+        elif self.action in ('bulk', 'export', 'import_habits', 'complete',
+                             'stats', 'global_stats'):
+            # Bulk actions are applied to habits of user
+            permission_classes = [IsAuthenticated]
         else:
             # All users
             permission_classes = []
@@ -56,5 +313,52 @@ class HabitPublicListAPIView(generics.ListAPIView):
     """
     List DRF generic for model `habit_tracker.Habit` for public habits
     """
-    queryset = Habit.objects.filter(is_public=True)
+    queryset = Habit.objects.filter(
+        is_public=True
+    ).order_by(*KeysetPaginator.ordering)
     serializer_class = HabitSerializer
+
+    def get_queryset(self):
+        """Load habits with related data"""
+        return HabitSerializer.setup_queryset(
+            super().get_queryset(), get_expand(self.request))
+
+    def get_serializer_context(self):
+        """
+        Pass related fields to be inlined to serializer. Pages of feed are
+        shared by all clients, so only public associated habits are inlined
+        """
+        context = super().get_serializer_context()
+        context['expand'] = get_expand(self.request)
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return cached page of public feed. Clients receive `304 Not
+        Modified` if public habits have not changed since their request
+        """
+        # Add pagination
+        if is_keyset_requested(request):
+            self.pagination_class = KeysetPaginator
+        else:
+            self.pagination_class = DefaultPaginator
+        # Version of feed is the time of the last change of public habits
+        version = cache.get_public_version()
+        key = cache.get_public_key(version, request.query_params)
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        last_modified = version // 1000
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            data = cache.get_list(key, request.resolver_match.view_name)
+            if data is None:
+                if get_expand(request):
+                    data = super().list(request, *args, **kwargs).data
+                else:
+                    data = list_values(self, self.queryset).data
+                cache.set_list(key, data)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
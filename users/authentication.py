@@ -0,0 +1,56 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users import cache
+from users.models import User
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication which takes user from process memory or cache, so
+    authenticated requests do not query database
+    """
+
+    def get_user_id(self, validated_token):
+        """Get ID of user the token was issued to"""
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user '
+                                 'identification'))
+
+    def check_user(self, user, validated_token):
+        """Check that user still can be authenticated by the token"""
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'),
+                                       code='user_inactive')
+        # Tokens are revoked by password change if it is enabled
+        if user.password_digest is not None and \
+                api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != \
+                    user.password_digest:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."),
+                    code='password_changed')
+        return user
+
+    def get_user(self, validated_token):
+        """Override super class method by reading user from cache"""
+        try:
+            user = cache.get_user(self.get_user_id(validated_token))
+        except (User.DoesNotExist, ValueError):
+            raise AuthenticationFailed(_('User not found'),
+                                       code='user_not_found')
+        return self.check_user(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        """Async version of `get_user`"""
+        try:
+            user = await cache.aget_user(self.get_user_id(validated_token))
+        except (User.DoesNotExist, ValueError):
+            raise AuthenticationFailed(_('User not found'),
+                                       code='user_not_found')
+        return self.check_user(user, validated_token)
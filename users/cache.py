@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+try:
+    from rest_framework_simplejwt.utils import get_md5_hash_password
+except ImportError:
+    # Revocation of tokens is not supported before version 5.3
+    get_md5_hash_password = None
+
+from users.models import User
+
+# Fields of user kept in cache. Other fields, including password and
+# permissions, are not cached and are loaded from database on access
+FIELDS = ('id', 'email', 'is_active', 'role', 'timezone')
+
+# Process-local entries of users by ID with time when they expire. The
+# least recently used users are evicted first
+_users = OrderedDict()
+_users_lock = threading.Lock()
+
+
+def get_key(user_id):
+    """Compose cache key of user"""
+    return f'users:{user_id}'
+
+
+def to_entry(values):
+    """
+    Compose cache entry from values of user. Only digest of password is
+    kept to check tokens revoked by password change
+    """
+    password = values.pop('password')
+    values['password_digest'] = get_md5_hash_password(password) \
+        if get_md5_hash_password else None
+    return values
+
+
+def to_user(entry):
+    """
+    Create user from cache entry. Each request gets its own instance, so it
+    can be changed safely
+    """
+    # Values are passed in order of model fields
+    names = [field.attname for field in User._meta.concrete_fields
+             if field.attname in FIELDS]
+    user = User.from_db(DEFAULT_DB_ALIAS, names,
+                        [entry[name] for name in names])
+    user.password_digest = entry['password_digest']
+    return user
+
+
+def get_local(user_id):
+    """Get entry of user from process memory unless it is expired"""
+    with _users_lock:
+        entry = _users.get(user_id)
+        if entry is None:
+            return None
+        expires, values = entry
+        if expires < time.monotonic():
+            del _users[user_id]
+            return None
+        _users.move_to_end(user_id)
+    return values
+
+
+def set_local(user_id, values):
+    """Keep entry of user in process memory for a few seconds"""
+    with _users_lock:
+        _users[user_id] = (time.monotonic()
+                           + settings.USER_CACHE_LOCAL_TTL, values)
+        _users.move_to_end(user_id)
+        while len(_users) > settings.USER_CACHE_LOCAL_SIZE:
+            _users.popitem(last=False)
+
+
+def get_user(user_id):
+    """
+    Get user by ID from process memory, then from cache and finally from
+    database. Raises `User.DoesNotExist` if there is no such user
+    """
+    entry = get_local(user_id)
+    if entry is None:
+        entry = cache.get(get_key(user_id))
+        if entry is None:
+            entry = to_entry(User.objects.values(
+                *FIELDS, 'password').get(pk=user_id))
+            cache.set(get_key(user_id), entry, settings.USER_CACHE_TTL)
+        set_local(user_id, entry)
+    return to_user(entry)
+
+
+async def aget_user(user_id):
+    """Async version of `get_user`"""
+    entry = get_local(user_id)
+    if entry is None:
+        entry = await cache.aget(get_key(user_id))
+        if entry is None:
+            entry = to_entry(await User.objects.values(
+                *FIELDS, 'password').aget(pk=user_id))
+            await cache.aset(get_key(user_id), entry,
+                             settings.USER_CACHE_TTL)
+        set_local(user_id, entry)
+    return to_user(entry)
+
+
+def invalidate(user_id):
+    """
+    Drop cached user after it is changed. Copies kept in memory of other
+    processes expire in `USER_CACHE_LOCAL_TTL` seconds
+    """
+    invalidate_many([user_id])
+
+
+def invalidate_many(user_ids):
+    """
+    Drop cached users after they are changed by `update()` or
+    `bulk_update()`, which do not send signals
+    """
+    with _users_lock:
+        for user_id in user_ids:
+            _users.pop(user_id, None)
+    cache.delete_many([get_key(user_id) for user_id in user_ids])
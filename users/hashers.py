@@ -0,0 +1,62 @@
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.encoding import force_bytes
+
+# Pool of processes computing hashes and ID of process which started it
+_pool = {'executor': None, 'pid': None}
+_pool_lock = threading.Lock()
+
+
+def pbkdf2(password, salt, iterations, digest_name):
+    """Compute PBKDF2 hash, executed by worker process"""
+    return hashlib.pbkdf2_hmac(digest_name, force_bytes(password),
+                               force_bytes(salt), iterations)
+
+
+def get_pool():
+    """
+    Get pool of `PASSWORD_HASH_WORKERS` processes or None if hashes are
+    computed by calling thread. Forked process starts its own pool
+    """
+    if not settings.PASSWORD_HASH_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool['pid'] != os.getpid():
+            # Workers are spawned, so they do not inherit threads and
+            # connections of web or Celery process
+            _pool.update(pid=os.getpid(), executor=ProcessPoolExecutor(
+                settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            ))
+        return _pool['executor']
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher with iterations set by `PASSWORD_HASH_ITERATIONS`, which
+    computes hashes in pool of processes if `PASSWORD_HASH_WORKERS` is set.
+    Hashes are compatible with the default hasher of Django
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        """Override super class method by computing hash in pool"""
+        pool = get_pool()
+        if pool is None:
+            return super().encode(password, salt, iterations)
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = pool.submit(pbkdf2, password, salt, iterations,
+                           self.digest().name).result()
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
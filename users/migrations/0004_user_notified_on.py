@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_telegram_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notified_on',
+            field=models.DateField(blank=True, null=True, verbose_name='notified_on'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_notified_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='Europe/Moscow', max_length=63, verbose_name='timezone'),
+        ),
+    ]
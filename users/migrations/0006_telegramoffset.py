@@ -0,0 +1,24 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(default=0, verbose_name='update_id')),
+            ],
+            options={
+                'verbose_name': 'telegram offset',
+                'verbose_name_plural': 'telegram offsets',
+            },
+        ),
+    ]
@@ -24,6 +24,11 @@ class User(AbstractUser):
     # Telegram unique ID
     telegram_id = models.BigIntegerField(verbose_name='telegram_id',
                                          **NULLABLE)
+    # Time zone of user for habit reminders
+    timezone = models.CharField(max_length=63, default='Europe/Moscow',
+                                verbose_name='timezone')
+    # Date of the last delivered digest
+    notified_on = models.DateField(verbose_name='notified_on', **NULLABLE)
 
     # Role for permissions
     role = models.CharField(max_length=9, choices=UserRoles.choices,
@@ -31,3 +36,28 @@ class User(AbstractUser):
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
+
+    # Time zone of user when it was loaded from database or saved
+    loaded_timezone = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember time zone of user loaded from database"""
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_timezone = instance.__dict__.get('timezone')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.loaded_timezone = self.__dict__.get('timezone')
+
+
+class TelegramOffset(models.Model):
+    """
+    Stores identifier of the next update to be received from Telegram Bot
+    """
+    update_id = models.BigIntegerField(default=0, verbose_name='update_id')
+
+    class Meta:
+        verbose_name = 'telegram offset'
+        verbose_name_plural = 'telegram offsets'
@@ -1,3 +1,6 @@
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 
 from config.services import get_bot_url
@@ -14,5 +17,26 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = '__all__'
 
+    def create(self, validated_data):
+        """
+        Hash password, so user is saved by a single query. Empty groups and
+        permissions are not set, since new user has none of them anyway
+        """
+        validated_data['password'] = make_password(validated_data['password'])
+        for field in ('groups', 'user_permissions'):
+            if not validated_data.get(field, True):
+                del validated_data[field]
+        return super().create(validated_data)
+
     def get_invite_link(self, obj):
         return get_bot_url()
+
+    def validate_timezone(self, value):
+        """
+        Validates time zone of user
+        """
+        try:
+            ZoneInfo(value)
+        except (ValueError, LookupError):
+            raise serializers.ValidationError("Unknown time zone")
+        return value
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users import cache
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    """
+    Drop cached user after it is changed or deleted. Request started before
+    commit can cache the previous version, so it is dropped once again
+    """
+    # New user cannot be cached yet
+    if kwargs.get('created'):
+        return
+    cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: cache.invalidate(instance.pk))
@@ -1,8 +1,21 @@
+import threading
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from users.models import User
+from config import services
+from config.services import get_bot_url, link_telegram_ids, \
+    refresh_bot_url
+from config.tasks import UPDATES_LOCK_KEY, update_telegram_ids
+from config.telegram_stub import TelegramStubServer
+from users import cache as user_cache
+from users.models import TelegramOffset, User
 
 
 class UserTest(APITestCase):
@@ -37,6 +50,25 @@ class UserTest(APITestCase):
             'test@gmail.com'
         )
 
+    def test_user_create_queries(self):
+        """
+        Testing that registered user is saved with hashed password by a
+        single insert
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/users/register/', data={
+                'email': 'test@gmail.com', 'password': 'test'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statements = [query['sql'].split()[0] for query in
+                      context.captured_queries]
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertNotIn('UPDATE', statements)
+        self.assertTrue(User.objects.get().check_password('test'))
+        # Token is issued for the password
+        response = self.client.post('/users/token/', data={
+            'email': 'test@gmail.com', 'password': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_createsuperuser_command(self):
         """
         Testings custom management command for superuser creation
@@ -54,3 +86,229 @@ class UserTest(APITestCase):
         self.assertTrue(
             user.is_superuser
         )
+
+
+class TelegramUpdatesTest(APITestCase):
+    """
+    Class for testing linking of users to Telegram chats
+    """
+
+    def setUp(self):
+        """Set up initial objects for each test"""
+        self.user = User.objects.create(email='test@gmail.com')
+
+    @staticmethod
+    def email_update(update_id, email, chat_id):
+        """Compose update of Telegram Bot with email message"""
+        return {
+            'update_id': update_id,
+            'message': {
+                'text': email,
+                'chat': {'id': chat_id},
+                'entities': [{'type': 'email'}],
+            }
+        }
+
+    def test_long_polling(self):
+        """Testing that updates are received starting from stored offset"""
+        updates = [
+            {'update_id': 10, 'message': {'text': 'hi', 'chat': {'id': 1}}},
+            self.email_update(11, 'test@gmail.com', 100),
+        ]
+        with TelegramStubServer(updates=updates) as stub, self.settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_POLL_DURATION=1.2):
+            update_telegram_ids()
+        # User is linked to chat and offset follows the last update
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.telegram_id, 100)
+        self.assertEqual(TelegramOffset.objects.get().update_id, 12)
+        # Long polling parameters are passed to Telegram
+        method, params = stub.requests[-1]
+        self.assertEqual(method, 'getUpdates')
+        self.assertEqual(params['offset'], '12')
+        self.assertEqual(params['allowed_updates'], '["message"]')
+
+    def test_single_poller(self):
+        """
+        Testing that polling is skipped while another run polls and stops
+        when Telegram refuses it
+        """
+        with TelegramStubServer() as stub, self.settings(
+                TELEGRAM_URL=stub.url, TELEGRAM_POLL_DURATION=5):
+            cache.add(UPDATES_LOCK_KEY, True)
+            update_telegram_ids()
+            self.assertEqual(stub.requests, [])
+            cache.delete(UPDATES_LOCK_KEY)
+            stub.conflict = True
+            update_telegram_ids()
+        self.assertEqual(len(stub.requests), 1)
+        # Lock is released after the run
+        self.assertTrue(cache.add(UPDATES_LOCK_KEY, True))
+        cache.delete(UPDATES_LOCK_KEY)
+
+    def test_webhook(self):
+        """Testing receiving of updates by webhook"""
+        update = self.email_update(1, 'test@gmail.com', 200)
+        with self.settings(TELEGRAM_WEBHOOK_SECRET='secret'):
+            # Requests without secret token are rejected
+            response = self.client.post('/users/telegram/webhook/',
+                                        data=update, format='json')
+            self.assertEqual(response.status_code,
+                             status.HTTP_403_FORBIDDEN)
+            response = self.client.post(
+                '/users/telegram/webhook/', data=update, format='json',
+                HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.telegram_id, 200)
+
+    def test_bulk_linking(self):
+        """Testing linking of users from a batch of updates"""
+        User.objects.create(email='second@gmail.com')
+        updates = [
+            self.email_update(1, 'test@gmail.com', 1),
+            self.email_update(2, 'second@gmail.com', 2),
+            self.email_update(3, 'unknown@gmail.com', 3),
+            self.email_update(4, 'test@gmail.com', 4),
+        ]
+        # Users are found by one query and updated by another one
+        with self.assertNumQueries(2):
+            link_telegram_ids(updates)
+        # The last message wins for duplicated email
+        self.assertEqual(
+            dict(User.objects.values_list('email', 'telegram_id')),
+            {'test@gmail.com': 4, 'second@gmail.com': 2}
+        )
+
+
+class BotUrlTest(APITestCase):
+    """
+    Class for testing cached invite link of Telegram Bot
+    """
+
+    def setUp(self):
+        """Reset cached link before each test"""
+        cache.clear()
+        services._bot_url.update(value=None, expires=0)
+
+    def test_fallback(self):
+        """Testing that configured bot is used until link is resolved"""
+        with self.settings(TELEGRAM_BOT_USERNAME='FallbackBot'):
+            self.assertEqual(get_bot_url(), 'https://t.me/FallbackBot')
+        # Link of unknown bot is not guessed
+        with self.settings(TELEGRAM_BOT_USERNAME=None):
+            self.assertIsNone(get_bot_url())
+
+    def test_cached_link(self):
+        """Testing that link is requested from Telegram only once"""
+        with TelegramStubServer(username='StubBot') as stub, self.settings(
+                TELEGRAM_URL=stub.url):
+            refresh_bot_url()
+            for _ in range(3):
+                self.assertEqual(get_bot_url(), 'https://t.me/StubBot')
+            # Link is also restored from Django cache in other processes
+            services._bot_url.update(value=None, expires=0)
+            self.assertEqual(get_bot_url(), 'https://t.me/StubBot')
+        self.assertEqual(len(stub.requests), 1)
+
+    def test_single_refresh(self):
+        """
+        Testing that link is refreshed by a single thread and errors of
+        configuration do not fail refresh
+        """
+        with services._bot_url_lock:
+            threads = threading.active_count()
+            for _ in range(3):
+                get_bot_url()
+            self.assertEqual(threading.active_count(), threads)
+        with self.settings(TELEGRAM_URL=None), \
+                self.assertLogs('config.services', 'WARNING'):
+            refresh_bot_url()
+        self.assertFalse(services._bot_url_lock.locked())
+
+
+class AuthenticationCacheTest(APITestCase):
+    """
+    Class for testing JWT authentication by cached users
+    """
+
+    def setUp(self):
+        """Create user and authorize client by its token"""
+        cache.clear()
+        user_cache._users.clear()
+        self.user = User.objects.create(email='test@gmail.com')
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_cached_user(self):
+        """Testing that authenticated requests do not query database"""
+        # The first request caches user and the list of habits
+        self.client.get('/habits/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # User is also restored from Django cache in other processes
+        user_cache._users.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalidation(self):
+        """Testing that changed and deleted users are not authenticated"""
+        self.client.get('/habits/')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'User is inactive')
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get('/habits/').status_code,
+                         status.HTTP_200_OK)
+        self.user.delete()
+        response = self.client.get('/habits/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'User not found')
+
+    def test_cached_fields(self):
+        """
+        Testing that credentials are not cached and users changed without
+        signals are invalidated
+        """
+        self.client.get('/habits/')
+        entry = cache.get(user_cache.get_key(self.user.pk))
+        self.assertEqual(set(entry), {*user_cache.FIELDS, 'password_digest'})
+        # Fields which are not cached are loaded on access
+        user = user_cache.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertFalse(user.is_superuser)
+        link_telegram_ids([
+            TelegramUpdatesTest.email_update(1, self.user.email, 5)])
+        self.assertIsNone(cache.get(user_cache.get_key(self.user.pk)))
+        self.assertEqual(user_cache.get_user(self.user.pk).telegram_id, 5)
+
+
+class PasswordHasherTest(APITestCase):
+    """
+    Class for testing configurable hasher of passwords
+    """
+
+    def test_iterations(self):
+        """Testing that passwords are hashed with configured iterations"""
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            encoded = make_password('secret')
+            self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+            self.assertTrue(check_password('secret', encoded))
+        # Hash of previous configuration is still valid
+        self.assertTrue(check_password('secret', encoded))
+
+    def test_pool(self):
+        """Testing that hashes computed by pool of processes are the same"""
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            encoded = make_password('secret', salt='salt')
+            with self.settings(PASSWORD_HASH_WORKERS=1):
+                self.assertEqual(make_password('secret', salt='salt'),
+                                 encoded)
+                self.assertTrue(check_password('secret', encoded))
+                self.assertFalse(check_password('wrong', encoded))
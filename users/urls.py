@@ -1,14 +1,16 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, \
-    TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from users.apps import UsersConfig
-from users.views import CreateUserAPIView
+from users.views import CreateUserAPIView, TelegramWebhookAPIView, \
+    TokenObtainAPIView
 
 app_name = UsersConfig.name
 
 urlpatterns = [
     path('register/', CreateUserAPIView.as_view(), name='register'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', TokenObtainAPIView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('telegram/webhook/', TelegramWebhookAPIView.as_view(),
+         name='telegram_webhook'),
 ]
@@ -1,5 +1,11 @@
-from rest_framework import generics
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from rest_framework import generics, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
 
+from config.services import link_telegram_ids
 from users.serializers import UserSerializer
 
 
@@ -9,9 +15,32 @@ class CreateUserAPIView(generics.CreateAPIView):
     """
     serializer_class = UserSerializer
     authentication_classes = []
+    throttle_scope = 'register'
 
-    def perform_create(self, serializer):
-        """Override super class method by setting password for new user"""
-        new_user = serializer.save()
-        new_user.set_password(new_user.password)
-        new_user.save()
+
+class TokenObtainAPIView(TokenObtainPairView):
+    """
+    Issues pair of tokens with rate limited by `token` scope against
+    guessing of passwords
+    """
+    throttle_scope = 'token'
+
+
+class TelegramWebhookAPIView(APIView):
+    """
+    Receives updates of Telegram Bot pushed by Telegram
+    """
+    authentication_classes = []
+    permission_classes = []
+    # Updates come from a few addresses of Telegram in bursts
+    throttle_classes = []
+
+    def post(self, request):
+        """Update Telegram IDs for users from a single update"""
+        # Only Telegram knows the secret token of webhook
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not settings.TELEGRAM_WEBHOOK_SECRET or not constant_time_compare(
+                token, settings.TELEGRAM_WEBHOOK_SECRET):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        link_telegram_ids([request.data])
+        return Response(status=status.HTTP_200_OK)